@@ -1,11 +1,26 @@
 import os
+import io
+import re
+import time
 import json
+import random
+import atexit
 import asyncio
+import hashlib
+import logging
+from collections import Counter, deque
+from itertools import islice
+from functools import lru_cache
+import httpx
+import orjson
 from google import genai
 from google.genai import types
-from gtts import gTTS
+from google.genai import errors as genai_errors
+from pydantic import BaseModel
+from PIL import Image
 from planner import Planner
 from memory import Memory
+from semantic_cache import SemanticCache
 
 # Ranking of model families (higher is smarter)
 # Note: models will be searched as substrings
@@ -24,67 +39,463 @@ MODEL_FAMILY_PRIORITY = [
     "gemini-flash-lite",
     "gemma"
 ]
+IMAGE_MODEL_PRIORITY = [
+    "imagen-4.0-ultra",
+    "imagen-4.0",
+    "nano-banana-pro",
+    "nano-banana",
+    "gemini-2.0-flash-exp-image-generation"
+]
+
+# Family -> score, precomputed once (dicts keep insertion order, so first match still wins)
+FAMILY_SCORES = {family: len(MODEL_FAMILY_PRIORITY) - i for i, family in enumerate(MODEL_FAMILY_PRIORITY)}
+IMAGE_FAMILY_SCORES = {family: len(IMAGE_MODEL_PRIORITY) - i for i, family in enumerate(IMAGE_MODEL_PRIORITY)}
+# Model names that can't serve text generation
+_NON_TEXT_MODEL_RE = re.compile(r"embedding|aqa|imagen|veo")
+
+def _family_score(name: str, scores: dict) -> int:
+    """Returns the score of the first family whose name appears in the model name, or -1."""
+    return next((score for family, score in scores.items() if family in name), -1)
+
+log = logging.getLogger(__name__)
+
+# Ranked model lists are cached on disk so startup can skip client.models.list()
+MODELS_CACHE_FILE = "models_cache.json"
+MODELS_CACHE_TTL = 24 * 3600
+
+# Per-chat history length; older entries are evicted as new ones arrive
+HISTORY_MAX_ENTRIES = 1000
+
+# HTTP statuses worth retrying (quota/rate limit, transient server errors); others are fatal
+_RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+_RETRYABLE_MARKERS = ("429", "resource_exhausted", "quota", "exhausted", "500", "internal", "503", "unavailable")
+
+def _is_retryable(e: Exception) -> bool:
+    """Classifies by exception type and status code; the message scan is only a last resort for untyped errors."""
+    if isinstance(e, genai_errors.APIError):
+        return e.code in _RETRYABLE_STATUS
+    if isinstance(e, (asyncio.TimeoutError, httpx.TimeoutException, httpx.TransportError)):
+        return True
+    err_str = str(e).lower()
+    return any(x in err_str for x in _RETRYABLE_MARKERS)
+
+def _is_not_found(e: Exception) -> bool:
+    if isinstance(e, genai_errors.APIError):
+        return e.code == 404
+    err_str = str(e).lower()
+    return "404" in err_str or "not found" in err_str
+
+def _is_model_not_found(e: Exception, model_name: str) -> bool:
+    """A 404 about the model itself, as opposed to e.g. an expired cached_content or a deleted upload."""
+    return _is_not_found(e) and model_name.removeprefix("models/").lower() in str(e).lower()
+
+# Per-request HTTP timeout for Gemini calls, so a hung connection fails over instead of stalling a turn
+GEMINI_HTTP_TIMEOUT_MS = 60_000
+
+# Minimum gap between background flushes of changed chat histories to disk
+SESSION_FLUSH_DELAY = 2.0
+# A chat log is rewritten as a snapshot once it holds this many add/update records
+SESSION_LOG_MAX_RECORDS = 3 * HISTORY_MAX_ENTRIES
+
+# Prompt budget for past interactions: per-field truncation plus a cap on the whole block
+HISTORY_CONTEXT_ENTRIES = 5
+HISTORY_CONTEXT_BUDGET = 4000
+
+# Retry policy for transient Gemini errors: a few attempts per model, then fall back to the next
+ATTEMPTS_PER_MODEL = 3
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+
+# Embedding model used to match near-duplicate questions against earlier DIRECT answers
+EMBEDDING_MODEL = "gemini-embedding-001"
+# Truncated embeddings keep the semantic cache's similarity scan cheap; 768 dims lose little matching quality
+_EMBED_CONFIG = types.EmbedContentConfig(output_dimensionality=768)
+# How long decide_strategy waits on the semantic cache before paying for a decide call anyway
+SEMANTIC_LOOKUP_TIMEOUT = 1.0
+
+# Lifetime of the server-side cache holding the system prompt
+PROMPT_CACHE_TTL = 3600
+
+# Request configs that never change, built once instead of per call
+_DECIDE_CONFIG = types.GenerateContentConfig(response_mime_type="application/json", temperature=0.1)
+_VERIFY_CONFIG = types.GenerateContentConfig(response_mime_type="application/json", temperature=0.1)
+_REFINE_CONFIG = types.GenerateContentConfig(temperature=0.3)
+_IMPROVE_CONFIG = types.GenerateContentConfig(response_mime_type="application/json")
+_TRANSCRIBE_CONFIG = types.GenerateContentConfig()
+
+# Field fills run one at a time (each focuses its element before typing) but need no settle delay
+_FIELD_ACTIONS = frozenset({"fill_id", "fill_by_label", "fill_by_placeholder"})
+# Actions that only observe the page; a turn made only of these isn't expected to change it
+_OBSERVE_ACTIONS = frozenset({"read", "inspect_form", "wait"})
+# Actions that leave the page exactly as it was (a `read` result stays valid across them);
+# consecutive ones run concurrently
+_READ_ONLY_ACTIONS = frozenset({"read", "inspect_form"})
+# Pause after a page-changing action (click, key, navigate, ...) before the next one
+ACTION_SETTLE_DELAY = 0.3
+
+# Submit-like clicks get a longer wait so the page can transition (reasoning / button text keywords)
+_SUBMIT_CLICK_RE = re.compile(r"login|iniciar|submit|sign in|guardar|save|register|registrar", re.I)
+_SUBMIT_BUTTON_RE = re.compile(r"iniciar|login|sign in|submit|guardar|registrar", re.I)
+
+# A rewritten system prompt must still document the JSON action format analyze_and_act relies on
+_PROMPT_ACTION_FORMAT = re.compile(r'"action"\s*:\s*"(?:click_id|fill_id|click|type|navigate|scroll|key|read|answer|done)"')
+
+# Constant frame labels for analyze_and_act, built once instead of on every turn
+_PREVIOUS_FRAME_LABELS = {
+    n: types.Part.from_text(text=f"\nPREVIOUS SCREENSHOT {n} STEPS AGO:") for n in (1, 2, 3)
+}
+_IDENTICAL_FRAMES_NOTES = {
+    n: types.Part.from_text(text=f"\n[PREVIOUS {n} SCREENSHOT(S) IDENTICAL TO CURRENT: the page has not visibly changed for {n} turn(s)]")
+    for n in (1, 2, 3)
+}
+_CURRENT_FRAME_LABEL = types.Part.from_text(text="\nCURRENT SCREENSHOT (THIS TURN):")
+_USER_IMAGE_LABEL = types.Part.from_text(text="\nUSER PROVIDED REFERENCE IMAGE:")
+
+# Screenshots are shrunk to fit this box before being sent to Gemini (fewer image tiles = fewer tokens)
+SCREENSHOT_MAX_SIZE = (1024, 1024)
+
+def _prep_screenshot(raw: bytes) -> tuple[bytes, float]:
+    """Downscales and recompresses a screenshot for the vision model.
+    Returns (jpeg_bytes, scale) where scale maps model coordinates back to page pixels."""
+    img = Image.open(io.BytesIO(raw)) # Lazy: only the header is parsed here
+    if img.format == "JPEG" and img.width <= SCREENSHOT_MAX_SIZE[0] and img.height <= SCREENSHOT_MAX_SIZE[1]:
+        return raw, 1.0 # Already small enough; re-encoding would only cost quality and CPU
+    img = img.convert("RGB")
+    original_width = img.width
+    img.thumbnail(SCREENSHOT_MAX_SIZE, Image.LANCZOS)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=72, optimize=True, progressive=False)
+    return buf.getvalue(), original_width / img.width
+
+class BrowserAction(BaseModel):
+    """A single browser action as described in system_prompt.txt."""
+    action: str
+    id: int | None = None
+    text: str | None = None
+    placeholder: str | None = None
+    label: str | None = None
+    coordinates: list[int] | None = None
+    key: str | None = None
+    direction: str | None = None
+    reasoning: str | None = None
+
+class ActionPlan(BaseModel):
+    """Structured response schema for analyze_and_act."""
+    thought: str | None = None
+    actions: list[BrowserAction]
+
+class ActionStreamParser:
+    """Incrementally extracts complete action objects from a streamed JSON response,
+    so each action can be dispatched before the rest of the response has arrived."""
+    _ACTIONS_ARRAY = re.compile(r'(?<!\\)"actions"\s*:\s*\[')
+
+    def __init__(self):
+        self.text = ""
+        self._pos = None # Scan position inside the actions array (None until it is found)
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._obj_start = 0
+        self._closed = False
+
+    def feed(self, chunk: str) -> list:
+        """Adds a chunk of response text and returns any action objects completed by it."""
+        self.text += chunk
+        if self._pos is None:
+            match = self._ACTIONS_ARRAY.search(self.text)
+            if match:
+                self._pos = match.end()
+            elif self.text.lstrip().startswith("["):
+                self._pos = self.text.index("[") + 1
+            else:
+                return []
+
+        actions = []
+        text = self.text
+        i = self._pos
+        while i < len(text) and not self._closed:
+            c = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif c == "\\":
+                    self._escaped = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c in "{[":
+                if self._depth == 0:
+                    self._obj_start = i
+                self._depth += 1
+            elif c in "}]":
+                if self._depth == 0:
+                    self._closed = True # End of the actions array
+                else:
+                    self._depth -= 1
+                    if self._depth == 0:
+                        try:
+                            action = orjson.loads(text[self._obj_start:i + 1])
+                        except orjson.JSONDecodeError:
+                            action = None
+                        if isinstance(action, dict):
+                            # Schema-constrained output may spell out unused fields as null
+                            actions.append({k: v for k, v in action.items() if v is not None})
+            i += 1
+        self._pos = i
+        return actions
+
+@lru_cache(maxsize=1)
+def _load_api_key() -> str:
+    """Reads the Gemini API key once per process."""
+    try:
+        with open("geminiapikey.txt", "r") as f:
+            api_key = f.read().strip()
+    except FileNotFoundError:
+        raise ValueError("geminiapikey.txt file not found. Please create it and add your Gemini API key.")
+        
+    if not api_key:
+        raise ValueError("geminiapikey.txt is empty")
+    return api_key
+
+@lru_cache(maxsize=1)
+def _load_prompt_text(path: str = "system_prompt.txt") -> str:
+    """Reads the system prompt once per process. Cleared when improve_prompt rewrites it."""
+    with open(path, "r") as f:
+        return f.read()
+
+def _trim_for_prompt(text, n: int) -> str:
+    """Truncates a history field for prompt use, marking the cut."""
+    text = "" if text is None else str(text)
+    return text if len(text) <= n else text[:n] + "…"
+
+def _recent_entries(chat_history, n: int = HISTORY_CONTEXT_ENTRIES) -> list:
+    """Returns the last n history entries, oldest first, without copying the whole deque."""
+    return list(islice(reversed(chat_history), n))[::-1]
+
+def _join_within_budget(header: str, lines: list, budget: int = HISTORY_CONTEXT_BUDGET) -> str:
+    """Joins header + the most recent (chronological) lines that fit within budget, in one pass."""
+    kept = []
+    used = len(header)
+    for line in reversed(lines):
+        used += len(line)
+        if used > budget:
+            break
+        kept.append(line)
+    kept.append(header)
+    return "".join(reversed(kept))
+
+def _action_names(actions_json) -> str:
+    """Summarizes a stored actions JSON string as its action types; the model doesn't need coordinates or reasoning."""
+    try:
+        actions = orjson.loads(actions_json)
+        return ", ".join(str(a.get("action")) for a in actions if isinstance(a, dict))
+    except (orjson.JSONDecodeError, TypeError, AttributeError):
+        return _trim_for_prompt(actions_json, 200)
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+@lru_cache(maxsize=16)
+def _read_image_cached(path: str, mtime_ns: int) -> bytes:
+    return _read_bytes(path)
+
+def _read_image(path: str) -> bytes | None:
+    """Reads an image file, reusing the bytes while its mtime is unchanged. None if it doesn't exist."""
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    return _read_image_cached(path, mtime_ns)
+
+def _write_bytes(path: str, data: bytes):
+    """Writes via a temp file + os.replace so a crash never leaves a truncated file behind."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def _write_text(path: str, text: str):
+    _write_bytes(path, text.encode("utf-8"))
+
+@lru_cache(maxsize=None)
+def _get_client(api_key: str):
+    """Shares one genai.Client (and its connection pool) per API key across Agents."""
+    return genai.Client(
+        api_key=api_key,
+        http_options=types.HttpOptions(
+            timeout=GEMINI_HTTP_TIMEOUT_MS,
+            # HTTP/2 multiplexes concurrent streams over one keep-alive connection
+            async_client_args={
+                "http2": True,
+                "limits": httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=120),
+            },
+        ),
+    )
+
+async def _safe(coro, default):
+    """Awaits coro, returning default instead of raising."""
+    try:
+        return await coro
+    except Exception:
+        return default
+
+async def _prepend_chunk(first_chunk, stream):
+    """Re-attaches an already consumed first chunk to the rest of a response stream."""
+    if first_chunk is not None:
+        yield first_chunk
+    async for chunk in stream:
+        yield chunk
 
 class Agent:
     def __init__(self, browser_manager):
         self.browser = browser_manager
         
-        try:
-            with open("geminiapikey.txt", "r") as f:
-                api_key = f.read().strip()
-        except FileNotFoundError:
-            raise ValueError("geminiapikey.txt file not found. Please create it and add your Gemini API key.")
-            
-        if not api_key:
-            raise ValueError("geminiapikey.txt is empty")
+        api_key = _load_api_key()
         
         # Set environment variable as fallback for some SDK calls
         os.environ["GOOGLE_API_KEY"] = api_key
         
-        self.client = genai.Client(api_key=api_key)
+        self.client = _get_client(api_key)
         
-        # Rank available models by smartness
-        self.ranked_models = self._get_ranked_models()
-        self.image_models = self._rank_image_models()
-        print(f"[MODELS] Found {len(self.ranked_models)} text models, {len(self.image_models)} image models.")
+        self._load_models()
         
         self.planner = Planner(self)
         self.memory = Memory()
         self.current_plan = None
+        # Embedding-keyed store of DIRECT answers, namespaced per chat (1h TTL)
+        self.semantic_cache = SemanticCache()
 
-        self.sessions_file = "sessions.json"
+        self.sessions_file = "sessions.json" # Legacy single-file store, migrated on startup
+        self.sessions_dir = "sessions"
+        # Per-chat log records not yet on disk, appended by a debounced flush
+        self._pending_records: dict = {}
+        # Records in each loaded chat's log file, used to decide when to compact it
+        self._log_records: dict = {}
+        # Bumped on every change to a chat's history; keys the memoized prompt context
+        self._history_versions: dict = {}
+        # (chat_id, with_actions) -> (history version, formatted prompt block)
+        self._history_contexts: dict = {}
+        self._flush_task = None
+        atexit.register(self.flush_sessions)
         self.history = self.load_sessions()
         self.learned_optimizations = self.load_learned_optimizations()
         self.system_instruction = ""
         self.load_prompt()
+        self._act_config = self._build_act_config()
+        # Hash of improve_prompt inputs + model -> parsed improvement response
+        self._improve_cache: dict[str, dict] = {}
+        # model_name -> (cache_name or None, created_at) for the cached system prompt
+        self._prompt_caches: dict = {}
         
         # Per-task step journal: reset at the start of each browser task.
         self._task_steps: list = []
-        self._task_screenshots: list = [] # Rolling buffer of last 10 screenshots
+        # Consecutive recorded steps on the same URL (and that URL), updated as steps are appended
+        self._url_stuck_count: int = 0
+        self._last_url: str = ""
+        self._url_counts: Counter = Counter() # URL -> recorded steps on it this task
+        self._task_screenshots: deque = deque(maxlen=10) # Rolling buffer of last 10 screenshots
+        self._task_screenshot_hashes: deque = deque(maxlen=10) # blake2b of each buffered screenshot
         self._last_action_errors: list = [] # Errors from the previous turn's actions
+        # Screenshot hash -> background Files API upload task, so a frame is only sent inline once
+        self._frame_uploads: dict = {}
+        # Background deletions of a finished task's uploaded frames, held until they complete
+        self._frame_cleanups: set = set()
+        # (url, screenshot hash) -> accessibility snapshot from the previous turn
+        self._last_dom_key = None
+        self._last_dom_snapshot: str = ""
+        # (url, screenshot hash) of the previous turn, to skip a model call when actions changed nothing
+        self._last_screen_key = None
+        self._skipped_unchanged_screen: bool = False
+        # Body text fetched by a `read` action this turn, while still current
+        self._turn_page_text = None
+        # Ratio between page pixels and the (downscaled) screenshot the model sees
+        self._screenshot_scale: float = 1.0
+
+        # Action name -> handler, built once so dispatch is a single dict lookup
+        self._action_handlers = {
+            "navigate": self._do_navigate,
+            "click": self._do_click,
+            "type": self._do_type,
+            "fill_by_placeholder": self._do_fill_by_placeholder,
+            "fill_by_label": self._do_fill_by_label,
+            "click_button": self._do_click_button,
+            "click_id": self._do_click_id,
+            "fill_id": self._do_fill_id,
+            "inspect_form": self._do_inspect_form,
+            "key": self._do_key,
+            "read": self._do_read,
+            "scroll": self._do_scroll,
+            "wait": self._do_wait,
+            "generate_image": self._do_generate_image,
+            "answer": self._do_answer,
+            "done": self._do_done,
+        }
         
-        # Legacy fingerprint fields (kept for compat, no longer used for detection)
-        self._last_action_fingerprint: str = ""
+        # Hash of the last recorded turn's actions as a sorted multiset (order-independent), and how many
+        # consecutive turns repeated that same set of actions
+        self._action_fp: int = 0
         self._stuck_count: int = 0
 
-    def _get_ranked_models(self):
-        """Discovers and ranks available Gemini models for the current API key."""
+    def _load_models(self):
+        """Ranks available models by smartness, reusing the on-disk ranking when fresh."""
+        cached_models = self._load_model_cache()
+        if cached_models:
+            self.ranked_models = cached_models["ranked"]
+            self.image_models = cached_models["image"]
+        else:
+            self._models_listed = True # Cleared if listing or ranking fails
+            # One listing call shared by both rankers
+            try:
+                available = list(self.client.models.list())
+            except Exception as e:
+                # If listing fails with 400 (API Key not found), it might be an SDK quirk.
+                # We already set the env var above, so subsequent calls might still work.
+                print(f"[MODELS] Warning: Could not list models ({e}). Models may still work if the key is valid.")
+                available = None
+            self.ranked_models = self._get_ranked_models(available)
+            self.image_models = self._rank_image_models(available)
+            if self._models_listed:
+                self._save_model_cache()
+        print(f"[MODELS] Found {len(self.ranked_models)} text models, {len(self.image_models)} image models.")
+
+    def _load_model_cache(self):
+        """Returns the cached model rankings, or None if missing or older than MODELS_CACHE_TTL."""
+        try:
+            with open(MODELS_CACHE_FILE, "rb") as f:
+                cache = orjson.loads(f.read())
+            if time.time() - cache["ts"] < MODELS_CACHE_TTL and cache["ranked"]:
+                return cache
+        except (FileNotFoundError, orjson.JSONDecodeError, KeyError, TypeError):
+            pass
+        return None
+
+    def _save_model_cache(self):
+        try:
+            _write_bytes(MODELS_CACHE_FILE, orjson.dumps({"ts": time.time(), "ranked": self.ranked_models, "image": self.image_models}))
+        except OSError as e:
+            print(f"[MODELS] Warning: Could not save model cache ({e}).")
+
+    def _invalidate_model_cache(self):
+        if os.path.exists(MODELS_CACHE_FILE):
+            os.remove(MODELS_CACHE_FILE)
+
+    def _get_ranked_models(self, available):
+        """Ranks the available Gemini models (as listed for the current API key) by smartness."""
         try:
-            available = list(self.client.models.list())
+            if available is None:
+                raise ValueError("model list unavailable")
             usable_models = []
             for m in available:
                 # We want models that support text/image generation
                 # In the new genai SDK, we check model names for keywords if attributes are missing
                 name = m.name.lower()
-                if "embedding" in name or "aqa" in name or "imagen" in name or "veo" in name:
+                if _NON_TEXT_MODEL_RE.search(name):
                     continue
                 
                 # Assign a score based on family priority
-                score = -1
-                for i, family in enumerate(MODEL_FAMILY_PRIORITY):
-                    if family in name:
-                        score = len(MODEL_FAMILY_PRIORITY) - i
-                        break
+                score = _family_score(name, FAMILY_SCORES)
                 
                 if score >= 0:
                     usable_models.append((m.name, score))
@@ -93,130 +504,332 @@ class Agent:
             usable_models.sort(key=lambda x: x[1], reverse=True)
             return [m[0] for m in usable_models]
         except Exception as e:
-            # If listing fails with 400 (API Key not found), it might be an SDK quirk.
-            # We already set the env var above, so subsequent calls might still work.
-            print(f"[MODELS] Warning: Could not list models ({e}). Models may still work if the key is valid.")
+            print(f"[MODELS] Warning: Could not rank models ({e}). Using fallback list.")
+            self._models_listed = False
             # Fallback to a common list of models
             return ["gemini-2.0-flash", "gemini-1.5-flash", "gemini-1.5-flash-8b", "gemini-1.0-pro"]
 
-    def _rank_image_models(self):
+    def _rank_image_models(self, available):
         """Finds and ranks available image generation models."""
         try:
-            available = list(self.client.models.list())
+            if available is None:
+                raise ValueError("model list unavailable")
             image_models = []
-            priority = ["imagen-4.0-ultra", "imagen-4.0", "nano-banana-pro", "nano-banana", "gemini-2.0-flash-exp-image-generation"]
             for m in available:
                 name = m.name.lower()
-                if "generateContent" in m.supported_generation_methods or "generate_image" in name: # fallback check
-                    score = -1
-                    for i, p in enumerate(priority):
-                        if p in name:
-                            score = len(priority) - i
-                            break
+                # supported_actions lists the API methods the model accepts (None when the listing omits it)
+                if "generateContent" in (m.supported_actions or []) or "generate_image" in name: # fallback check
+                    score = _family_score(name, IMAGE_FAMILY_SCORES)
                     if score >= 0:
                         image_models.append((m.name, score))
             
             image_models.sort(key=lambda x: x[1], reverse=True)
             return [m[0] for m in image_models]
-        except:
+        except Exception as e:
+            print(f"[MODELS] Warning: Could not rank image models ({e}). Using fallback model.")
+            self._models_listed = False
             return ["models/nano-banana-pro-preview"]
 
-    async def _call_gemini(self, contents, config, candidates=None):
-        """Attempts to call Gemini using a list of models, falling back on failure."""
+    async def _get_prompt_cache(self, model_name):
+        """Returns the name of a server-side cache holding the system prompt for model_name,
+        or None if the model (or prompt size) doesn't support explicit caching."""
+        cached = self._prompt_caches.get(model_name)
+        if cached and time.time() - cached[1] < PROMPT_CACHE_TTL - 60:
+            return cached[0]
+        try:
+            cache = await self.client.aio.caches.create(
+                model=model_name,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=self.system_instruction,
+                    ttl=f"{PROMPT_CACHE_TTL}s",
+                ),
+            )
+            print(f"[CACHE] Cached system prompt for {model_name}: {cache.name}")
+            self._prompt_caches[model_name] = (cache.name, time.time())
+            return cache.name
+        except Exception as e:
+            # Remember the failure so we don't retry on every turn
+            print(f"[CACHE] Could not cache system prompt for {model_name}: {e}")
+            self._prompt_caches[model_name] = (None, time.time())
+            return None
+
+    async def _invalidate_prompt_caches(self):
+        """Deletes all cached system prompts. Call this whenever the system prompt changes."""
+        for cache_name, _ in self._prompt_caches.values():
+            if cache_name:
+                try:
+                    await self.client.aio.caches.delete(name=cache_name)
+                except Exception as e:
+                    print(f"[CACHE] Could not delete {cache_name}: {e}")
+        self._prompt_caches = {}
+
+    async def _retry_sleep(self, attempt: int):
+        """Exponential backoff with full jitter, so concurrent retries don't hit the quota in lockstep."""
+        await asyncio.sleep(random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt))))
+
+    async def _call_gemini(self, contents, config, candidates=None, use_prompt_cache=False, stream=False):
+        """Attempts to call Gemini using a list of models, retrying each a few times before falling back.
+        With use_prompt_cache, the system prompt is served from a server-side cache when possible.
+        With stream, returns an async iterator of response chunks instead of a full response."""
         models_to_try = candidates if candidates else self.ranked_models
         last_error = None
         
         for model_name in models_to_try:
-            try:
-                print(f"[FALLBACK] Trying model: {model_name}")
-                response = await self.client.aio.models.generate_content(
-                    model=model_name,
-                    contents=contents,
-                    config=config
-                )
-                return response
-            except Exception as e:
-                err_str = str(e).lower()
-                # Check if it's a retryable error (quota, rate limit, internal)
-                if any(x in err_str for x in ["429", "resource_exhausted", "quota", "exhausted", "500", "internal", "503", "unavailable"]):
-                    print(f"[FALLBACK] Model {model_name} failed: {e}. Trying next...")
-                    last_error = e
-                    await asyncio.sleep(1) # Small delay before fallback
-                    continue
-                else:
-                    # Non-retryable error (invalid prompt, etc.)
-                    print(f"[ERROR] Non-retryable error with {model_name}: {e}")
-                    raise e
+            for attempt in range(ATTEMPTS_PER_MODEL):
+                try:
+                    print(f"[FALLBACK] Trying model: {model_name} (attempt {attempt + 1}/{ATTEMPTS_PER_MODEL})")
+                    call_config = config
+                    if use_prompt_cache and config.system_instruction == self.system_instruction:
+                        cache_name = await self._get_prompt_cache(model_name)
+                        if cache_name:
+                            call_config = config.model_copy(update={"system_instruction": None, "cached_content": cache_name})
+                    if stream:
+                        response_stream = await self.client.aio.models.generate_content_stream(
+                            model=model_name,
+                            contents=contents,
+                            config=call_config
+                        )
+                        # Pull the first chunk here so quota/server errors still trigger the fallback
+                        first_chunk = await anext(response_stream, None)
+                        return _prepend_chunk(first_chunk, response_stream)
+                    response = await self.client.aio.models.generate_content(
+                        model=model_name,
+                        contents=contents,
+                        config=call_config
+                    )
+                    return response
+                except Exception as e:
+                    # Check if it's a retryable error (quota, rate limit, internal)
+                    if _is_retryable(e):
+                        print(f"[FALLBACK] Model {model_name} failed: {e}. Retrying...")
+                        last_error = e
+                        await self._retry_sleep(attempt)
+                        continue
+                    else:
+                        # Non-retryable error (invalid prompt, etc.)
+                        print(f"[ERROR] Non-retryable error with {model_name}: {e}")
+                        if _is_model_not_found(e, model_name):
+                            # The cached ranking may list a retired model; rediscover on next start
+                            self._invalidate_model_cache()
+                        raise e
+            print(f"[FALLBACK] Giving up on {model_name}. Trying next model...")
         
         raise last_error or Exception("No models available to fulfill the request.")
 
     async def _call_image_gen(self, prompt):
-        """Attempts to generate an image using available image models, falling back on failure."""
+        """Attempts to generate an image using available image models, retrying each a few times before falling back."""
         last_error = None
         for model_name in self.image_models:
-            try:
-                print(f"[FALLBACK] Trying image model: {model_name}")
-                response = await asyncio.wait_for(
-                    self.client.aio.models.generate_content(
-                        model=model_name,
-                        contents=prompt
-                    ),
-                    timeout=60
-                )
-                return response, model_name
-            except Exception as e:
-                err_str = str(e).lower()
-                if any(x in err_str for x in ["429", "resource_exhausted", "quota", "exhausted", "500", "internal", "503", "unavailable"]):
-                    print(f"[FALLBACK] Image model {model_name} failed: {e}. Trying next...")
-                    last_error = e
-                    await asyncio.sleep(1)
-                    continue
-                else:
-                    print(f"[ERROR] Non-retryable error with image model {model_name}: {e}")
-                    raise e
+            for attempt in range(ATTEMPTS_PER_MODEL):
+                try:
+                    print(f"[FALLBACK] Trying image model: {model_name} (attempt {attempt + 1}/{ATTEMPTS_PER_MODEL})")
+                    response = await asyncio.wait_for(
+                        self.client.aio.models.generate_content(
+                            model=model_name,
+                            contents=prompt
+                        ),
+                        timeout=60
+                    )
+                    return response, model_name
+                except Exception as e:
+                    if _is_retryable(e):
+                        print(f"[FALLBACK] Image model {model_name} failed: {e}. Retrying...")
+                        last_error = e
+                        await self._retry_sleep(attempt)
+                        continue
+                    else:
+                        print(f"[ERROR] Non-retryable error with image model {model_name}: {e}")
+                        raise e
         raise last_error or Exception("No image models available.")
 
+    def _session_path(self, chat_id_str: str) -> str:
+        return os.path.join(self.sessions_dir, f"{chat_id_str}.jsonl")
+
+    def _read_session(self, chat_id_str: str) -> tuple:
+        """Replays one chat's append-only log from disk. Returns (history, record count);
+        the history is empty if the log is missing. A torn last line from a crash is skipped."""
+        hist, records = deque(maxlen=HISTORY_MAX_ENTRIES), 0
+        try:
+            with open(self._session_path(chat_id_str), "rb") as f:
+                for line in f:
+                    try:
+                        record = orjson.loads(line)
+                    except orjson.JSONDecodeError:
+                        continue
+                    records += 1
+                    if record["op"] == "add":
+                        hist.append(record["entry"])
+                    elif hist:
+                        # Updates always target the latest entry (verification / refined result)
+                        for field, value in record["set"].items():
+                            hist[-1][int(field)] = value
+        except FileNotFoundError:
+            pass
+        return hist, records
+
+    @staticmethod
+    def _snapshot_session(hist) -> bytes:
+        """Serializes a whole history as "add" records, the compacted form of a chat log."""
+        return b"".join(orjson.dumps({"op": "add", "entry": entry}) + b"\n" for entry in hist)
+
     def load_sessions(self):
+        """Prepares the per-chat sessions directory. Chats are read lazily by get_history,
+        so this returns an empty in-memory cache. Older sessions.json / per-chat .json stores are converted once."""
+        os.makedirs(self.sessions_dir, exist_ok=True)
+        if os.path.exists(self.sessions_file):
+            try:
+                with open(self.sessions_file, "rb") as f:
+                    sessions = orjson.loads(f.read())
+                for cid, hist in sessions.items():
+                    _write_bytes(self._session_path(cid), self._snapshot_session(hist))
+                os.replace(self.sessions_file, self.sessions_file + ".migrated")
+                print(f"[SESSIONS] Migrated {len(sessions)} chats from {self.sessions_file} to {self.sessions_dir}/")
+            except (OSError, orjson.JSONDecodeError) as e:
+                print(f"[SESSIONS] Warning: Could not migrate {self.sessions_file} ({e}).")
+        for name in os.listdir(self.sessions_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.sessions_dir, name)
+            try:
+                with open(path, "rb") as f:
+                    hist = orjson.loads(f.read())
+                _write_bytes(self._session_path(name[:-5]), self._snapshot_session(hist))
+                os.remove(path)
+            except (OSError, orjson.JSONDecodeError) as e:
+                print(f"[SESSIONS] Warning: Could not convert {path} ({e}).")
+        return {}
+
+    def _append_session_record(self, chat_id_str: str, record: dict):
+        """Queues one log record for a chat. Inside the event loop, queued records are appended together by a
+        debounced background flush (at most once per SESSION_FLUSH_DELAY); otherwise immediately."""
+        # Every history mutation is logged through here, so this is also where cached prompt context goes stale
+        self._history_versions[chat_id_str] = self._history_versions.get(chat_id_str, 0) + 1
+        self._pending_records.setdefault(chat_id_str, []).append(orjson.dumps(record) + b"\n")
         try:
-            with open(self.sessions_file, "r") as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush_sessions()
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._debounced_flush())
 
-    def save_sessions(self):
-        """Saves history to sessions.json, ensuring the file doesn't exceed 100MB."""
-        max_size = 100 * 1024 * 1024  # 100 MB
-        
-        # Pruning loop: if the total JSON string size is > 1MB, 
-        # remove the oldest entry from the user with the longest history.
-        while True:
-            json_data = json.dumps(self.history, indent=4)
-            if len(json_data) <= max_size:
-                break
-                
-            # Find the user with the most interactions
-            best_target = None
-            max_len = 0
-            for cid, hist in self.history.items():
-                if len(hist) > max_len:
-                    max_len = len(hist)
-                    best_target = cid
-            
-            if best_target and max_len > 0:
-                self.history[best_target].pop(0) # Remove oldest
+    def _take_pending_sessions(self) -> dict:
+        """Drains the queued records into {chat_id: (compact, data)}. A chat whose log has grown past
+        SESSION_LOG_MAX_RECORDS is compacted into a fresh snapshot instead of appended to.
+        Runs on the loop so a background write never sees a history mid-edit."""
+        batch = {}
+        for cid, records in self._pending_records.items():
+            count = self._log_records.get(cid, 0) + len(records)
+            if count > SESSION_LOG_MAX_RECORDS:
+                hist = self.get_history(cid)
+                batch[cid] = (True, self._snapshot_session(hist))
+                self._log_records[cid] = len(hist)
             else:
-                # If all histories are empty but still > 1MB (unlikely but safe), stop
-                break
+                batch[cid] = (False, b"".join(records))
+                self._log_records[cid] = count
+        self._pending_records.clear()
+        return batch
+
+    async def _debounced_flush(self):
+        # Loop so records queued while a write is in flight are picked up by this same task
+        while self._pending_records:
+            await asyncio.sleep(SESSION_FLUSH_DELAY)
+            batch = self._take_pending_sessions()
+            try:
+                self._drop_pruned(await asyncio.to_thread(self._write_sessions, batch))
+            except OSError as e:
+                print(f"[SESSIONS] Warning: Could not save sessions ({e}).")
+
+    def flush_sessions(self):
+        """Writes any queued records synchronously (also registered to run at exit)."""
+        if self._pending_records:
+            self._drop_pruned(self._write_sessions(self._take_pending_sessions()))
 
-        with open(self.sessions_file, "w") as f:
-            f.write(json.dumps(self.history, indent=4))
+    def _write_sessions(self, batch: dict) -> list:
+        paths = set()
+        for cid, (compact, data) in batch.items():
+            path = self._session_path(cid)
+            if compact:
+                _write_bytes(path, data)
+            else:
+                with open(path, "ab") as f:
+                    f.write(data)
+            paths.add(path)
+        return self._prune_sessions(keep=paths)
+
+    def _drop_pruned(self, pruned: list):
+        for cid in pruned:
+            self.history.pop(cid, None)
+            self._log_records.pop(cid, None)
+            self._history_versions[cid] = self._history_versions.get(cid, 0) + 1
+            self._history_contexts.pop((cid, False), None)
+            self._history_contexts.pop((cid, True), None)
 
-    def get_history(self, chat_id: str) -> list:
+    def _prune_sessions(self, keep: set) -> list:
+        """Deletes the least recently written chat logs while the directory exceeds the size cap.
+        Returns the pruned chat ids; touches only the filesystem so it is safe to run off the loop."""
+        max_size = 100 * 1024 * 1024  # 100 MB
+        files = []
+        with os.scandir(self.sessions_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".jsonl"):
+                    st = entry.stat()
+                    files.append((st.st_mtime, st.st_size, entry.path, entry.name[:-6]))
+        total = sum(f[1] for f in files)
+        pruned = []
+        if total <= max_size:
+            return pruned
+        files.sort() # Oldest write first
+        for _, size, path, cid in files:
+            if total <= max_size:
+                break
+            if path in keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            pruned.append(cid)
+            total -= size
+            print(f"[SESSIONS] Pruned inactive chat {cid} to stay under the size cap.")
+        return pruned
+
+    def get_history(self, chat_id: str) -> deque:
         chat_id_str = str(chat_id)
         if chat_id_str not in self.history:
-            self.history[chat_id_str] = []
+            self.history[chat_id_str], self._log_records[chat_id_str] = self._read_session(chat_id_str)
         return self.history[chat_id_str]
 
+    def _history_context(self, chat_id_str: str, with_actions: bool) -> str:
+        """Formats the recent-interactions prompt block for a chat. Memoized per history version,
+        so repeated turns in a chat skip the rewalk until add_to_history/update_* bump the version."""
+        key = (chat_id_str, with_actions)
+        version = self._history_versions.get(chat_id_str, 0)
+        cached = self._history_contexts.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        context = self._format_history_context(chat_id_str, with_actions)
+        self._history_contexts[key] = (version, context)
+        return context
+
+    def _format_history_context(self, chat_id_str: str, with_actions: bool) -> str:
+        chat_history = self.get_history(chat_id_str)
+        if not chat_history:
+            return ""
+        if not with_actions:
+            return _join_within_budget(
+                "PREVIOUS INTERACTIONS:\n",
+                [f"- User: {_trim_for_prompt(entry[0], 300)}\n  Result: {_trim_for_prompt(entry[2], 500)}\n"
+                 for entry in _recent_entries(chat_history)],
+            )
+        return _join_within_budget(
+            "RECENT INTERACTIONS (last 5, use this context to inform your next actions):\n",
+            [f"- User: {_trim_for_prompt(entry[0], 300)}\n"
+             f"  Action Taken: {_action_names(entry[1]) if len(entry) > 1 else ''}\n"
+             f"  Result: {_trim_for_prompt(entry[2], 500) if len(entry) > 2 else ''}\n"
+             for entry in _recent_entries(chat_history)], # Only take the last 5 entries
+        ) + "\n"
+
     def load_learned_optimizations(self):
         """Loads learned optimizations from a local file."""
         try:
@@ -231,10 +844,10 @@ class Agent:
         chat_id_str = str(chat_id)
         hist = self.get_history(chat_id_str)
         # Entry format: [user_instr, actions_json, final_result, verification_status, verification_feedback]
-        hist.append([user_instruction, json.dumps(actions_data), final_result, None, None])
-        if len(hist) > 1000:
-            hist.pop(0)
-        self.save_sessions()
+        # The deque's maxlen evicts the oldest entry once the chat reaches HISTORY_MAX_ENTRIES
+        entry = [user_instruction, orjson.dumps(actions_data).decode(), final_result, None, None]
+        hist.append(entry)
+        self._append_session_record(chat_id_str, {"op": "add", "entry": entry})
 
     def update_verification_to_history(self, chat_id: str, success: bool, feedback: str):
         chat_id_str = str(chat_id)
@@ -243,7 +856,7 @@ class Agent:
             # Update the latest entry (which was just added in solve_autonomous)
             hist[-1][3] = success
             hist[-1][4] = feedback
-            self.save_sessions()
+            self._append_session_record(chat_id_str, {"op": "update", "set": {"3": success, "4": feedback}})
             # Record in memory ledger
             self.memory.add_experience(hist[-1][0], success, feedback)
 
@@ -252,47 +865,129 @@ class Agent:
         hist = self.get_history(chat_id_str)
         if hist:
             hist[-1][2] = refined_result
-            self.save_sessions()
+            self._append_session_record(chat_id_str, {"op": "update", "set": {"2": refined_result}})
 
     def reset_task_steps(self):
         """Resets the per-task step journal and screenshot buffer. Call this at the start of every new browser task."""
         self._task_steps = []
-        self._task_screenshots = []
+        self._url_stuck_count, self._last_url = 0, ""
+        self._url_counts.clear()
+        self._task_screenshots.clear()
+        self._task_screenshot_hashes.clear()
         self._last_action_errors = []
-        self._last_action_fingerprint = ""
+        self._discard_frame_uploads()
+        self._last_dom_key = self._last_screen_key = None
+        self._skipped_unchanged_screen = False
+        self._action_fp = 0
         self._stuck_count = 0
         self.current_plan = None # Clear plan for new task
         print("[STEP JOURNAL] Reset for new task.")
 
+    async def _upload_frame(self, frame: bytes) -> types.File:
+        """Uploads a screenshot to the Files API and returns the uploaded file."""
+        return await self.client.aio.files.upload(
+            file=io.BytesIO(frame),
+            config=types.UploadFileConfig(mime_type="image/jpeg"),
+        )
+
+    def _discard_frame_uploads(self):
+        """Cancels the previous task's in-flight frame uploads and deletes the finished ones in the background."""
+        uploads, self._frame_uploads = self._frame_uploads, {}
+        names = []
+        for upload in uploads.values():
+            if not upload.done():
+                upload.cancel()
+            elif not upload.cancelled() and upload.exception() is None:
+                names.append(upload.result().name)
+        if not names:
+            return
+        try:
+            cleanup = asyncio.create_task(self._delete_frames(names))
+        except RuntimeError:
+            return # No event loop; the Files API expires them on its own after 48 hours
+        self._frame_cleanups.add(cleanup)
+        cleanup.add_done_callback(self._frame_cleanups.discard)
+
+    async def _delete_frames(self, names: list):
+        results = await asyncio.gather(
+            *(self.client.aio.files.delete(name=name) for name in names), return_exceptions=True
+        )
+        failed = sum(isinstance(r, Exception) for r in results)
+        if failed:
+            print(f"[FILES] Could not delete {failed} of {len(names)} uploaded frames; they expire after 48 hours.")
+
+    def _frame_part(self, frame: bytes, frame_hash: bytes = None):
+        """Returns a Part for a screenshot. The first time a frame is seen it is sent inline
+        while it uploads in the background; later turns reference the uploaded file instead."""
+        frame_hash = frame_hash or hashlib.blake2b(frame, digest_size=16).digest()
+        upload = self._frame_uploads.get(frame_hash)
+        if upload is None:
+            self._frame_uploads[frame_hash] = asyncio.create_task(self._upload_frame(frame))
+        elif upload.done() and not upload.cancelled() and upload.exception() is None:
+            return types.Part.from_uri(file_uri=upload.result().uri, mime_type="image/jpeg")
+        return types.Part.from_bytes(data=frame, mime_type="image/jpeg")
+
+    def _build_act_config(self):
+        """Builds the analyze_and_act config once per system prompt instead of on every turn."""
+        return types.GenerateContentConfig(
+            system_instruction=self.system_instruction,
+            response_mime_type="application/json",
+            response_schema=ActionPlan,
+            temperature=0.4, # Lower temperature for more deterministic actions
+        )
+
     def load_prompt(self):
         try:
-            with open("system_prompt.txt", "r") as f:
-                self.system_instruction = f.read()
+            self.system_instruction = _load_prompt_text()
         except FileNotFoundError:
             print("Warning: system_prompt.txt not found. Please ensure it exists.")
             self.system_instruction = ""
             
+    async def _embed(self, text: str):
+        """Returns the embedding vector for text, or None if the embedding call fails."""
+        try:
+            result = await self.client.aio.models.embed_content(model=EMBEDDING_MODEL, contents=text, config=_EMBED_CONFIG)
+            return result.embeddings[0].values
+        except Exception as e:
+            print(f"[CACHE] Embedding failed, skipping semantic cache: {e}")
+            return None
+
+    async def _lookup_direct_answer(self, chat_id_str: str, user_instruction: str) -> tuple:
+        """Embeds the instruction and looks up a near-duplicate DIRECT answer in this chat.
+        Returns (query_vector, cached_data); any failure counts as a miss."""
+        query_vector = await self._embed(user_instruction)
+        if query_vector is None:
+            return None, None
+        try:
+            cached = await asyncio.to_thread(self.semantic_cache.lookup, chat_id_str, query_vector)
+            data = orjson.loads(cached) if cached else None
+            return query_vector, data if isinstance(data, dict) else None
+        except Exception as e:
+            print(f"[CACHE] Semantic cache lookup failed, treating it as a miss: {e}")
+            return query_vector, None
+
     async def decide_strategy(self, user_instruction: str, chat_id: int) -> tuple[str, str, str]:
         """
         Asks Gemini if the user instruction requires a browser or if it can be answered directly.
         Returns a tuple: (strategy, response_text, image_prompt). Strategy can be 'BROWSER', 'DIRECT', or 'IMAGE'.
         """
         chat_id_str = str(chat_id)
-        chat_history = self.get_history(chat_id_str)
-        history_context = ""
-        if chat_history:
-            history_context = "PREVIOUS INTERACTIONS:\n"
-            for entry in chat_history:
-                history_context += f"- User: {entry[0]}\n  Result: {entry[2]}\n"
+
+        # Near-duplicate of a recent DIRECT question in this chat? Reuse its answer.
+        # The lookup starts now so it overlaps building the prompt; decide is only sent on a miss.
+        lookup = asyncio.create_task(self._lookup_direct_answer(chat_id_str, user_instruction))
+
+        history_context = self._history_context(chat_id_str, False)
 
         memory_context = self.memory.get_context_summary()
 
+        # Slow-changing blocks first: Gemini's implicit cache reuses an identical prompt prefix across calls
         decision_prompt = f"""
-{history_context}
-{memory_context}
 LEARNED OPTIMIZATIONS:
 {self.learned_optimizations}
 
+{memory_context}
+{history_context}
 USER REQUEST: {user_instruction}
 
 Analyze the user request. Decide if you need to:
@@ -309,18 +1004,34 @@ Return a JSON object:
   "image_prompt": "Specific prompt for the image if strategy is IMAGE, otherwise null"
 }}
 """
+        try:
+            # Shielded so a slow lookup keeps running: its vector is still needed to store a fresh answer
+            _, cached = await asyncio.wait_for(asyncio.shield(lookup), SEMANTIC_LOOKUP_TIMEOUT)
+        except asyncio.TimeoutError:
+            print("[CACHE] Semantic cache lookup is slow; deciding without it.")
+            cached = None
+        if cached is not None:
+            print("[CACHE] Semantic cache hit for DIRECT answer.")
+            return "DIRECT", cached.get("direct_answer", ""), user_instruction
+
         try:
             response = await self._call_gemini(
                 contents=decision_prompt,
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json",
-                    temperature=0.1,
-                ),
+                config=_DECIDE_CONFIG,
             )
-            data = json.loads(response.text)
+            data = orjson.loads(response.text)
             strategy = data.get("strategy", "BROWSER")
             answer = data.get("direct_answer", "")
             image_prompt = data.get("image_prompt", user_instruction)
+
+            # Only DIRECT answers are cached; browser results depend on live page content
+            if strategy != "DIRECT" or not answer:
+                lookup.cancel()
+            elif (query_vector := (await lookup)[0]) is not None:
+                try:
+                    await asyncio.to_thread(self.semantic_cache.store, chat_id_str, query_vector, orjson.dumps(data))
+                except Exception as e:
+                    print(f"[CACHE] Could not store DIRECT answer: {e}")
             
             # If BROWSER, create a plan
             if strategy == "BROWSER":
@@ -332,17 +1043,17 @@ Return a JSON object:
             print(f"Error deciding strategy: {e}")
             return "BROWSER", "", user_instruction
 
-    async def verify_result(self, user_instruction: str, result_text: str = None, image_path: str = None, user_image_path: str = None) -> tuple[bool, str]:
+    async def verify_result(self, user_instruction: str, result_text: str = None, image_path: str = None, user_image: bytes = None) -> tuple[bool, str]:
         """
         Asks Gemini to verify if the result (text or image) matches the user's original request.
         Returns a tuple: (is_correct_bool, feedback_message)
         """
         verification_prompt = f"""
-USER ORIGINAL REQUEST: {user_instruction}
-
 LEARNED OPTIMIZATIONS:
 {self.learned_optimizations}
 
+USER ORIGINAL REQUEST: {user_instruction}
+
 RESULT TO VERIFY:
 {result_text if result_text else "(Image file generated)"}
 
@@ -359,37 +1070,33 @@ Return a JSON object:
         try:
             # Prepare image parts if provided
             parts = [types.Part.from_text(text=verification_prompt)]
-            if image_path and os.path.exists(image_path):
-                with open(image_path, "rb") as f:
-                    parts.append(types.Part.from_bytes(data=f.read(), mime_type="image/jpeg"))
-            if user_image_path and os.path.exists(user_image_path):
-                with open(user_image_path, "rb") as f:
-                    parts.append(types.Part.from_bytes(data=f.read(), mime_type="image/jpeg"))
+            result_image = await asyncio.to_thread(_read_image, image_path) if image_path else None
+            for image in (result_image, user_image):
+                if image:
+                    parts.append(types.Part.from_bytes(data=image, mime_type="image/jpeg"))
 
             response = await self._call_gemini(
                 contents=parts,
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json",
-                    temperature=0.1,
-                ),
+                config=_VERIFY_CONFIG,
             )
-            data = json.loads(response.text)
+            data = orjson.loads(response.text)
             return data.get("success", False), data.get("feedback", "No feedback provided.")
         except Exception as e:
             print(f"Error during verification: {e}")
             return True, "Verification failed due to technical error, assuming success."
 
-    async def refine_answer(self, user_instruction: str, raw_browser_output: str, chat_id: int) -> str:
+    async def refine_answer(self, user_instruction: str, raw_browser_output: str, chat_id: int, on_partial=None) -> str:
         """
         Takes the raw output from the autonomous browser loop and asks Gemini to reformat/refine it 
         to perfectly match the user's original request.
+        The answer is streamed; on_partial, if given, is awaited with the accumulated text as it grows.
         """
         refine_prompt = f"""
-USER ORIGINAL REQUEST: {user_instruction}
-
 LEARNED OPTIMIZATIONS:
 {self.learned_optimizations}
 
+USER ORIGINAL REQUEST: {user_instruction}
+
 RAW BROWSER DATA GATHERED:
 {raw_browser_output}
 
@@ -398,33 +1105,30 @@ If the technical status says 'Task completed' or 'Action: answer', extract the r
 Do NOT mention the browser actions or JSON technical details. Just answer the user.
 """
         try:
-            response = await self._call_gemini(
+            stream = await self._call_gemini(
                 contents=refine_prompt,
-                config=types.GenerateContentConfig(
-                    temperature=0.3,
-                ),
+                config=_REFINE_CONFIG,
+                stream=True,
             )
-            return response.text.strip()
+            text = ""
+            async for chunk in stream:
+                if chunk.text:
+                    text += chunk.text
+                    if on_partial:
+                        await on_partial(text)
+            return text.strip()
         except Exception as e:
             print(f"Error refining answer: {e}")
             return raw_browser_output
 
     async def improve_prompt(self):
         try:
-            # Load session history for analysis
-            history_summary = ""
-            if os.path.exists(self.sessions_file):
-                with open(self.sessions_file, "r") as f:
-                    sessions = json.load(f)
-                    # Extract recent failures or noteworthy interactions
-                    count = 0
-                    for cid, hist in sessions.items():
-                        for entry in hist[-10:]: # Look at last 10 per user
-                            if len(entry) >= 5 and entry[3] is False: # It failed
-                                history_summary += f"FAILED TASK: {entry[0]}\nREASON: {entry[4]}\n"
-                                count += 1
-                                if count > 20: break
-            
+            # Every failed verification is already recorded in the experience ledger (last 20 kept),
+            # so there's no need to replay each chat's session log to find them
+            history_summary = "".join(
+                f"FAILED TASK: {f['instruction']}\nREASON: {f['feedback']}\n"
+                for f in self.memory.experience["failures"]
+            )
             improvement_instruction = f'''
 Analyze the following session history and the current system prompt.
 Your goal is to evolve the bot's behavior to avoid these failures in the future.
@@ -449,25 +1153,37 @@ Return a JSON object:
 }}
 '''
             try:
-                response = await self._call_gemini(
-                    contents=improvement_instruction,
-                    config=types.GenerateContentConfig(
-                        response_mime_type="application/json",
-                    ),
-                )
-                data = json.loads(response.text)
+                # Identical inputs to the same model give the same rewrite; skip the round-trip
+                top_model = self.ranked_models[0] if self.ranked_models else ""
+                cache_key = hashlib.blake2b(improvement_instruction.encode()).hexdigest() + top_model
+                data = self._improve_cache.get(cache_key)
+                if data is None:
+                    response = await self._call_gemini(
+                        contents=improvement_instruction,
+                        config=_IMPROVE_CONFIG,
+                    )
+                    data = orjson.loads(response.text)
+                    self._improve_cache[cache_key] = data
+                else:
+                    print("[IMPROVE] Inputs unchanged since a previous run, reusing its result.")
                 new_prompt = data.get("new_system_prompt")
                 new_opts = data.get("new_learned_optimizations")
 
+                if new_prompt and not _PROMPT_ACTION_FORMAT.search(new_prompt):
+                    print("[IMPROVE] Rejected new system prompt: it no longer documents the JSON action format.")
+                    new_prompt = None
+
                 if new_prompt:
                     self.system_instruction = new_prompt
-                    with open("system_prompt.txt", "w") as f:
-                        f.write(new_prompt)
+                    # Write off the event loop so concurrent chats aren't stalled
+                    await asyncio.to_thread(_write_text, "system_prompt.txt", new_prompt)
+                    _load_prompt_text.cache_clear()
+                    self._act_config = self._build_act_config()
+                    await self._invalidate_prompt_caches()
                 
                 if new_opts:
                     self.learned_optimizations = new_opts
-                    with open("learned_optimizations.txt", "w") as f:
-                        f.write(new_opts)
+                    await asyncio.to_thread(_write_text, "learned_optimizations.txt", new_opts)
 
                 return "Prompts improved based on session history!"
             except Exception as inner:
@@ -478,32 +1194,228 @@ Return a JSON object:
             print(f"Error in improve_prompt: {e}")
             return None
 
-    async def analyze_and_act(self, user_instruction: str, screenshot_bytes: bytes, chat_id: int, user_image_path: str = None) -> tuple[str, bool, str]:
+    # --- Action handlers ---
+    # Each handler takes the action dict and returns (action_result, final_result, is_done):
+    # action_result is checked for errors to feed back next turn, final_result (if not None)
+    # becomes the turn's result, and is_done ends the task.
+
+    async def _do_navigate(self, action_data):
+        action_result = await self.browser.navigate(action_data.get("text", ""))
+        await self.browser.smart_wait(5000)
+        # Reloads can change the DOM without changing the URL
+        self._last_dom_key = self._last_screen_key = None
+        return action_result, None, False
+
+    def _page_point(self, x, y) -> tuple[int, int]:
+        """Maps screenshot coordinates from the model back to page pixels."""
+        return int(x * self._screenshot_scale), int(y * self._screenshot_scale)
+
+    async def _do_click(self, action_data):
+        match action_data.get("coordinates"):
+            case [x, y]:
+                action_result = await self.browser.click(*self._page_point(x, y))
+            case _:
+                action_result = f"Warning: click action missing valid coordinates: {action_data}"
+                print(action_result)
+                return action_result, None, False
+        # Longer wait after submit-like clicks to allow page transitions
+        if _SUBMIT_CLICK_RE.search(action_data.get("reasoning") or ""):
+            await self.browser.smart_wait(5000)
+        return action_result, None, False
+
+    async def _do_type(self, action_data):
+        text = action_data.get("text", "")
+        # Use fill_field: triple-click to select all existing content, then type
+        # This REPLACES whatever is in the field instead of appending.
+        match action_data.get("coordinates"):
+            case [x, y]:
+                action_result = await self.browser.fill_field(*self._page_point(x, y), text)
+            case _:
+                action_result = await self.browser.type_text(text)
+        return action_result, None, False
+
+    # --- Semantic (coordinate-free) actions — PREFERRED for forms ---
+    async def _do_fill_by_placeholder(self, action_data):
+        text = action_data.get("text", "")
+        placeholder = action_data.get("placeholder", text)
+        action_result = await self.browser.fill_by_placeholder(placeholder, text)
+        print(f"  → {action_result}")
+        return action_result, None, False
+
+    async def _do_fill_by_label(self, action_data):
+        text = action_data.get("text", "")
+        label = action_data.get("label", text)
+        action_result = await self.browser.fill_by_label(label, text)
+        print(f"  → {action_result}")
+        return action_result, None, False
+
+    async def _do_click_button(self, action_data):
+        text = action_data.get("text", "")
+        action_result = await self.browser.click_by_text(text)
+        print(f"  → {action_result}")
+        if _SUBMIT_BUTTON_RE.search(text):
+            await self.browser.smart_wait(5000)
+        return action_result, None, False
+
+    # --- SoM Actions ---
+    async def _do_click_id(self, action_data):
+        som_id = action_data.get("id", action_data.get("text", ""))
+        action_result = await self.browser.click_by_id(som_id)
+        print(f"  → {action_result}")
+        return action_result, None, False
+
+    async def _do_fill_id(self, action_data):
+        action_result = await self.browser.fill_by_id(action_data.get("id"), action_data.get("text", ""))
+        print(f"  → {action_result}")
+        return action_result, None, False
+
+    async def _do_inspect_form(self, action_data):
+        fields_json = await self.browser.get_form_fields()
+        final_result = f"Form fields: {fields_json}"
+        print(f"  → {final_result[:200]}")
+        return None, final_result, False
+
+    async def _do_key(self, action_data):
+        action_result = await self.browser.press_key(action_data.get("key", "") or action_data.get("text", ""))
+        return action_result, None, False
+
+    async def _do_read(self, action_data):
+        page_text = await self.browser.get_text_content()
+        self._turn_page_text = page_text # Reused by the step journal if nothing changes the page afterwards
+        return None, page_text[:2000] if page_text else "No text found.", False
+
+    async def _do_scroll(self, action_data):
+        direction = action_data.get("direction", "down").lower()
+        return await self.browser.scroll(direction), None, False
+
+    async def _do_wait(self, action_data):
+        await self.browser.smart_wait(3000)
+        return None, None, False
+
+    async def _do_generate_image(self, action_data):
+        return None, await self.generate_image(action_data.get("text", "")), True
+
+    async def _do_answer(self, action_data):
+        return None, action_data.get("text", ""), True
+
+    async def _do_done(self, action_data):
+        return None, action_data.get("text", "") or "Task completed.", True
+
+    async def _execute_action(self, action_data: dict) -> tuple[str, bool]:
+        """
+        Executes a single action from Gemini's response.
+        Returns a tuple: (final_result_or_None, is_done_boolean).
+        """
+        action = action_data.get("action")
+        print(f"Executing Action: {action} ({action_data.get('reasoning', '')})")
+
+        handler = self._action_handlers.get(action)
+        if handler is None:
+            print(f"  → Unknown action: {action}")
+            return None, False
+        if action not in _READ_ONLY_ACTIONS:
+            self._turn_page_text = None # Page may change; a text read earlier this turn is stale
+        action_result, final_result, is_done = await handler(action_data)
+        if is_done:
+            return final_result, True
+        
+        # --- Action Feedback Loop: track errors for next turn ---
+        if action_result and isinstance(action_result, str) and "error" in action_result.lower():
+            self._last_action_errors.append(f"{action}: {action_result}")
+            print(f"  ⚠️ [ERROR TRACKED] {action}: {action_result}")
+
+        return final_result, False
+
+    async def _run_actions(self, actions, executed: list) -> tuple[str, bool]:
+        """Executes actions from an (async) iterable, appending each to executed.
+        Read-only actions start immediately and run concurrently; the batch is awaited before the
+        next action that touches the page. Page-changing actions are followed by a short settle delay.
+        Returns (last_final_result_or_None, is_done)."""
+        final_result, is_done = None, False
+        batch = []
+
+        async def flush_batch():
+            nonlocal final_result
+            results = await asyncio.gather(*(task for _, task in batch), return_exceptions=True)
+            for (action_data, _), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    self._last_action_errors.append(f"{action_data.get('action')}: {result}")
+                    print(f"  ⚠️ [ERROR TRACKED] {action_data.get('action')}: {result}")
+                elif result[0] is not None:
+                    final_result = result[0]
+            batch.clear()
+
+        try:
+            async for action_data in actions:
+                executed.append(action_data)
+                if action_data.get("action") in _READ_ONLY_ACTIONS:
+                    batch.append((action_data, asyncio.create_task(self._execute_action(action_data))))
+                    continue
+                if batch:
+                    await flush_batch()
+                action_final_result, is_done = await self._execute_action(action_data)
+                if action_final_result is not None:
+                    final_result = action_final_result
+                if is_done:
+                    break
+                # Let the page react to the click/key/navigation before the next action
+                if action_data.get("action") not in _FIELD_ACTIONS:
+                    await asyncio.sleep(ACTION_SETTLE_DELAY)
+        finally:
+            if batch:
+                await flush_batch()
+        return final_result, is_done
+
+    async def analyze_and_act(self, user_instruction: str, screenshot_bytes: bytes, chat_id: int, user_image: bytes = None) -> tuple[str, bool]:
         """
         Sends screenshot + instruction to Gemini Vision, gets a JSON action (or array of actions), and executes it.
-        Returns a tuple: (status_string, is_done_boolean, audio_path_string) to help the bot know when to stop.
+        Returns a tuple: (status_string, is_done_boolean) to help the bot know when to stop.
         """
         if not screenshot_bytes:
-             return "Error: No browser screenshot available. Did you navigate somewhere?", True, None
+             return "Error: No browser screenshot available. Did you navigate somewhere?", True
+
+        try:
+            # Pillow releases the GIL while decoding/resizing/encoding, so a thread keeps the loop free
+            screenshot_bytes, self._screenshot_scale = await asyncio.to_thread(_prep_screenshot, screenshot_bytes)
+        except Exception as e:
+            print(f"[SCREENSHOT] Could not downscale screenshot, sending original: {e}")
+            self._screenshot_scale = 1.0
+        frame_hash = hashlib.blake2b(screenshot_bytes, digest_size=16).digest()
+        try:
+            page_url = await self.browser.get_url()
+        except Exception:
+            page_url = ""
+        screen_key = (page_url, frame_hash)
+
+        # Already repeating actions, the last turn acted on the page and it is still pixel-identical:
+        # skip one model call and report that instead (a first identical frame may just be a slow render)
+        last_acted = bool(self._task_steps) and any(a.get("action") not in _OBSERVE_ACTIONS for a in self._task_steps[-1]["actions"])
+        if (self._stuck_count > 0 and screen_key == self._last_screen_key and last_acted
+                and not self._skipped_unchanged_screen):
+            self._skipped_unchanged_screen = True
+            # The next turn must see a fresh capture, not the cached frame just reported as unchanged
+            self.browser.invalidate_screenshot_cache()
+            self._last_action_errors.append("Screenshot unchanged since last turn: your previous actions had no visible effect. Choose a different approach.")
+            print("[SCREEN DEDUP] Page unchanged since last turn; skipping model call.")
+            return "Page unchanged since last turn; previous actions had no effect. Trying a different approach...", False
+        self._skipped_unchanged_screen = False
+        self._last_screen_key = screen_key
 
         # 1. Compile History into Prompt
         chat_id_str = str(chat_id)
-        chat_history = self.get_history(chat_id_str)
-        history_context = ""
-        if chat_history:
-            history_context = "RECENT INTERACTIONS (last 5, use this context to inform your next actions):\n"
-            for entry in chat_history[-5:]: # Only take the last 5 entries
-                past_instruction = entry[0]
-                past_action = entry[1] if len(entry) > 1 else ""
-                past_result = entry[2] if len(entry) > 2 else ""
-                history_context += f"- User: {past_instruction}\n  Action Taken: {past_action}\n  Result: {past_result}\n"
-            history_context += "\n"
+        history_context = self._history_context(chat_id_str, True)
 
         memory_context = self.memory.get_context_summary()
-        plan_context = f"\nCURRENT GLOBAL PLAN:\n{json.dumps(self.current_plan, indent=2)}\n" if self.current_plan else ""
+        # Compact JSON: indentation only adds prompt tokens
+        plan_context = f"\nCURRENT GLOBAL PLAN:\n{orjson.dumps(self.current_plan).decode()}\n" if self.current_plan else ""
         dom_snapshot = ""
         try:
-            dom_snapshot = await self.browser.get_accessibility_snapshot()
+            # Same URL and pixel-identical screenshot as last turn: the DOM hasn't changed either
+            if screen_key == self._last_dom_key:
+                dom_snapshot = self._last_dom_snapshot
+            else:
+                dom_snapshot = await self.browser.get_accessibility_snapshot()
+                self._last_dom_key, self._last_dom_snapshot = screen_key, dom_snapshot
         except:
             pass
         dom_context = f"\nDOM SNAPSHOT (Interactive Elements):\n{dom_snapshot}\n" if dom_snapshot else ""
@@ -536,30 +1448,19 @@ Return a JSON object:
         if self._task_steps:
             journal_lines = ["\nCURRENT TASK PROGRESS (your step-by-step actions so far for THIS task):"]
             for step in self._task_steps:
-                actions_summary = ", ".join(
-                    f"{a.get('action')}({a.get('text','')[:30] or a.get('coordinates','')})"
-                    for a in step["actions"]
-                )
-                journal_lines.append(f"  Turn {step['turn']}: [URL: {step.get('url','?')}] {actions_summary}")
-                if step.get("page_text"):
-                    journal_lines.append(f"    → Page snippet: {step['page_text'][:150]}")
+                journal_lines.append(step["journal"])
             
             # --- URL-based stuck detection ---
             # If the URL hasn't changed for 3+ consecutive turns, the bot is stuck.
-            recent_urls = [s.get("url", "") for s in self._task_steps[-6:]]
-            # Count trailing consecutive identical URLs
-            url_stuck_count = 1
-            for i in range(len(recent_urls) - 2, -1, -1):
-                if recent_urls[i] == recent_urls[-1]:
-                    url_stuck_count += 1
-                else:
-                    break
+            # Trailing run of identical URLs, maintained as each step is recorded
+            url_stuck_count = self._url_stuck_count
+            stuck_url = self._last_url
             
-            print(f"[STUCK DETECTION] URL={recent_urls[-1]!r}, same for {url_stuck_count} consecutive turns.")
+            print(f"[STUCK DETECTION] URL={stuck_url!r}, same for {url_stuck_count} consecutive turns.")
             
             if url_stuck_count >= 3:
                 journal_lines.append(
-                    f"\n  ⛔ CRITICAL STUCK ALERT: The page URL has been '{recent_urls[-1]}' for "
+                    f"\n  ⛔ CRITICAL STUCK ALERT: The page URL has been '{stuck_url}' for "
                     f"{url_stuck_count} consecutive turns. YOUR ACTIONS ARE HAVING NO EFFECT ON THE PAGE. "
                     "You MUST abandon the current approach and try something completely different:\n"
                     "  1. Try using browser's built-in form fill: use 'navigate' to the page URL again (hard refresh).\n"
@@ -570,11 +1471,17 @@ Return a JSON object:
                 )
                 if self.current_plan:
                    try:
-                       self.current_plan = await self.planner.update_plan(self.current_plan, len(self._task_steps), f"Stuck on URL {recent_urls[-1]} for {url_stuck_count} turns.")
+                       self.current_plan = await self.planner.update_plan(self.current_plan, len(self._task_steps), f"Stuck on URL {stuck_url} for {url_stuck_count} turns.")
                        print(f"[RE-PLANNING] Updated plan: {json.dumps(self.current_plan, indent=2)}")
                    except Exception as plan_err:
                        print(f"[RE-PLANNING ERROR] {plan_err}")
             
+            if self._stuck_count >= 2:
+                journal_lines.append(
+                    f"\n  ⚠️ REPEATED ACTIONS: your last {self._stuck_count + 1} turns issued the same set of actions. "
+                    "Repeating them again will not help; choose a different action."
+                )
+            
             prompt_parts.append("\n".join(journal_lines))
         
         prompt = "\n".join(prompt_parts)
@@ -582,8 +1489,7 @@ Return a JSON object:
         # --- Manage Screenshot History ---
         # Add current screenshot to history (keep last 10)
         self._task_screenshots.append(screenshot_bytes)
-        if len(self._task_screenshots) > 10:
-            self._task_screenshots.pop(0)
+        self._task_screenshot_hashes.append(frame_hash)
 
         try:
             # Build content parts: text prompt + historical screenshots + current screenshot + optional user image
@@ -591,174 +1497,146 @@ Return a JSON object:
             
             # Add up to 3 previous screenshots for visual loop comparison
             # We don't want to overload with all 10, but 3 previous + 1 current is enough to see a stall.
-            hist_frames = self._task_screenshots[-4:-1] # Get 3 frames before the current one
-            for i, frame in enumerate(hist_frames):
-                parts.append(types.Part.from_text(text=f"\nPREVIOUS SCREENSHOT {len(hist_frames)-i} STEPS AGO:"))
-                parts.append(types.Part.from_bytes(data=frame, mime_type="image/jpeg"))
+            hist_frames = list(zip(self._task_screenshots, self._task_screenshot_hashes))[-4:-1] # Get 3 frames before the current one
+            # Frames identical to the current one add nothing visual; note the stall instead of re-sending them
+            same_as_current = 0
+            while hist_frames and hist_frames[-1][1] == frame_hash:
+                hist_frames.pop()
+                same_as_current += 1
+            for i, (frame, h) in enumerate(hist_frames):
+                if i + 1 < len(hist_frames) and hist_frames[i + 1][1] == h:
+                    continue # Same as the next (newer) frame, which is sent instead
+                parts.append(_PREVIOUS_FRAME_LABELS[len(hist_frames) - i + same_as_current])
+                parts.append(self._frame_part(frame, h))
+            if same_as_current:
+                parts.append(_IDENTICAL_FRAMES_NOTES[same_as_current])
             
-            parts.append(types.Part.from_text(text="\nCURRENT SCREENSHOT (THIS TURN):"))
-            parts.append(types.Part.from_bytes(data=screenshot_bytes, mime_type="image/jpeg"))
+            parts.append(_CURRENT_FRAME_LABEL)
+            parts.append(self._frame_part(screenshot_bytes, frame_hash))
 
-            if user_image_path and os.path.exists(user_image_path):
-                parts.append(types.Part.from_text(text="\nUSER PROVIDED REFERENCE IMAGE:"))
-                with open(user_image_path, "rb") as f:
-                    parts.append(types.Part.from_bytes(data=f.read(), mime_type="image/jpeg"))
+            if user_image:
+                parts.append(_USER_IMAGE_LABEL)
+                # Same path as the screenshots: inline once, then the uploaded file on later turns
+                parts.append(self._frame_part(user_image))
 
-            response = await self._call_gemini(
+            stream = await self._call_gemini(
                 contents=[
                     types.Content(
                         role="user",
                         parts=parts,
                     ),
                 ],
-                config=types.GenerateContentConfig(
-                    system_instruction=self.system_instruction,
-                    response_mime_type="application/json",
-                    temperature=0.4, # Lower temperature for more deterministic actions
-                ),
+                config=self._act_config,
+                use_prompt_cache=True,
+                stream=True,
             )
-            
-            response_text = response.text
-            print(f"Gemini Response: {response_text}") # Debug log
 
-            try:
-                data = json.loads(response_text)
-                # Ensure we are working with a list of actions
-                if isinstance(data, dict):
-                    if "actions" in data and isinstance(data["actions"], list):
-                        actions_data = data["actions"]
-                        thought = data.get("thought", "")
-                        if thought:
-                            print(f"\n[THOUGHT]: {thought}\n")
-                    else:
-                        actions_data = [data] # fallback
-                elif isinstance(data, list):
-                    actions_data = data
-                else:
-                    return "Error: Gemini did not return a valid action array or object.", False, None
-            except json.JSONDecodeError:
-                return f"Error: Gemini returned invalid JSON: {response_text}", False, None
+            # Dispatch each action as soon as its JSON object has streamed in, so browser
+            # work overlaps with the model still decoding the rest of the response.
+            parser = ActionStreamParser()
+            pending_actions = asyncio.Queue()
+
+            async def pump_stream():
+                try:
+                    async for chunk in stream:
+                        if chunk.text:
+                            for streamed_action in parser.feed(chunk.text):
+                                pending_actions.put_nowait(streamed_action)
+                finally:
+                    pending_actions.put_nowait(None)
 
-            is_done = False
+            async def streamed_actions():
+                while (streamed_action := await pending_actions.get()) is not None:
+                    yield streamed_action
+
+            self._turn_page_text = None
+            pump_task = asyncio.create_task(pump_stream())
             final_result = "Processing..."
-            
-            # Execute multiple actions
-            for action_data in actions_data:
-                action = action_data.get("action")
-                text = action_data.get("text", "")
-                coordinates = action_data.get("coordinates")
-                key = action_data.get("key", "")
-                reasoning = action_data.get("reasoning", "")
-                
-                print(f"Executing Action: {action} ({reasoning})")
-                
-                action_result = None  # Track result for error feedback
-
-                if action == "navigate":
-                    action_result = await self.browser.navigate(text)
-                    await self.browser.smart_wait(5000)
-                elif action == "click":
-                    if coordinates and len(coordinates) == 2:
-                        action_result = await self.browser.click(int(coordinates[0]), int(coordinates[1]))
-                        # Longer wait after submit-like clicks to allow page transitions
-                        if any(kw in reasoning.lower() for kw in ["login", "iniciar", "submit", "sign in", "guardar", "save", "register", "registrar"]):
-                            await self.browser.smart_wait(5000)
-                    else:
-                        action_result = f"Warning: click action missing valid coordinates: {action_data}"
-                        print(action_result)
-                elif action == "type":
-                    # Use fill_field: triple-click to select all existing content, then type
-                    # This REPLACES whatever is in the field instead of appending.
-                    if coordinates and len(coordinates) == 2:
-                        action_result = await self.browser.fill_field(int(coordinates[0]), int(coordinates[1]), text)
+            actions_data = []
+            try:
+                action_final_result, is_done = await self._run_actions(streamed_actions(), actions_data)
+                if action_final_result is not None:
+                    final_result = action_final_result
+                if not is_done:
+                    await pump_task # Surface stream errors
+            finally:
+                if not pump_task.done():
+                    pump_task.cancel() # Task finished early; the rest of the response is irrelevant
+
+            response_text = parser.text
+            log.debug("Gemini Response: %s", response_text)
+
+            if not actions_data:
+                # Nothing streamed as an action list (e.g. a bare single-action object): parse the whole reply
+                try:
+                    # orjson accepts str directly and decodes noticeably faster than stdlib json
+                    data = orjson.loads(response_text)
+                    # Ensure we are working with a list of actions
+                    if isinstance(data, dict):
+                        if "actions" in data and isinstance(data["actions"], list):
+                            actions_data = data["actions"]
+                            thought = data.get("thought", "")
+                            if thought:
+                                print(f"\n[THOUGHT]: {thought}\n")
+                        else:
+                            actions_data = [data] # fallback
+                    elif isinstance(data, list):
+                        actions_data = data
                     else:
-                        action_result = await self.browser.type_text(text)
-                # --- Semantic (coordinate-free) actions — PREFERRED for forms ---
-                elif action == "fill_by_placeholder":
-                    placeholder = action_data.get("placeholder", text)
-                    action_result = await self.browser.fill_by_placeholder(placeholder, text)
-                    print(f"  → {action_result}")
-                elif action == "fill_by_label":
-                    label = action_data.get("label", text)
-                    action_result = await self.browser.fill_by_label(label, text)
-                    print(f"  → {action_result}")
-                elif action == "click_button":
-                    action_result = await self.browser.click_by_text(text)
-                    print(f"  → {action_result}")
-                    if any(kw in text.lower() for kw in ["iniciar", "login", "sign in", "submit", "guardar", "registrar"]):
-                        await self.browser.smart_wait(5000)
-                # --- SoM Actions ---
-                elif action == "click_id":
-                    som_id = action_data.get("id", text)
-                    action_result = await self.browser.click_by_id(som_id)
-                    print(f"  → {action_result}")
-                elif action == "fill_id":
-                    som_id = action_data.get("id")
-                    action_result = await self.browser.fill_by_id(som_id, text)
-                    print(f"  → {action_result}")
-                elif action == "inspect_form":
-                    fields_json = await self.browser.get_form_fields()
-                    final_result = f"Form fields: {fields_json}"
-                    print(f"  → {final_result[:200]}")
-                elif action == "key":
-                    action_result = await self.browser.press_key(key or text)
-                elif action == "read":
-                    page_text = await self.browser.get_text_content()
-                    final_result = page_text[:2000] if page_text else "No text found."
-                elif action == "scroll":
-                    direction = action_data.get("direction", "down").lower()
-                    action_result = await self.browser.scroll(direction)
-                elif action == "wait":
-                    await self.browser.smart_wait(3000)
-                elif action == "generate_image":
-                    final_result = await self.generate_image(text)
-                    is_done = True
-                    break
-                elif action == "answer":
-                    final_result = text
-                    is_done = True
-                    break
-                elif action == "done":
-                    final_result = text or "Task completed."
-                    is_done = True
-                    break
-                
-                # --- Action Feedback Loop: track errors for next turn ---
-                if action_result and isinstance(action_result, str) and "error" in action_result.lower():
-                    self._last_action_errors.append(f"{action}: {action_result}")
-                    print(f"  ⚠️ [ERROR TRACKED] {action}: {action_result}")
+                        return "Error: Gemini did not return a valid action array or object.", False
+                except orjson.JSONDecodeError:
+                    return f"Error: Gemini returned invalid JSON: {response_text}", False
 
-                # Small delay between chained actions to let the page update
-                await asyncio.sleep(0.3)
+                async def parsed_actions():
+                    for action_data in actions_data:
+                        yield action_data
+
+                action_final_result, is_done = await self._run_actions(parsed_actions(), [])
+                if action_final_result is not None:
+                    final_result = action_final_result
             
             # --- Record this turn in the step journal ---
-            page_text_snippet = ""
-            current_url = ""
-            try:
-                page_text_snippet = await self.browser.get_text_content()
-                page_text_snippet = page_text_snippet[:300] if page_text_snippet else ""
-            except Exception:
-                pass
-            try:
-                current_url = await self.browser.get_url()
-            except Exception:
-                pass
+            # Text and URL are independent browser round-trips; fetch them concurrently
+            if self._turn_page_text is None:
+                page_text_snippet, current_url = await asyncio.gather(
+                    _safe(self.browser.get_text_content_prefix(300), ""),
+                    _safe(self.browser.get_url(), ""),
+                )
+            else:
+                page_text_snippet, current_url = self._turn_page_text, await _safe(self.browser.get_url(), "")
+            page_text_snippet = page_text_snippet[:300] if page_text_snippet else ""
             
+            # Render the step's journal line(s) once; every later turn replays them verbatim
+            turn = len(self._task_steps) + 1
+            actions_summary = ", ".join(
+                f"{d.get('action')}({d.get('text','')[:30] or d.get('coordinates','')})"
+                for d in actions_data
+            )
+            journal = f"  Turn {turn}: [URL: {current_url or '?'}] {actions_summary}"
+            if page_text_snippet:
+                journal += f"\n    → Page snippet: {page_text_snippet[:150]}"
             self._task_steps.append({
-                "turn": len(self._task_steps) + 1,
-                "actions": [
-                    {"action": d.get("action"), "text": d.get("text", ""), 
-                     "coordinates": d.get("coordinates"), "reasoning": d.get("reasoning", "")}
-                    for d in actions_data
-                ],
+                "turn": turn,
+                "actions": [{"action": d.get("action")} for d in actions_data],
+                "journal": journal,
                 "page_text": page_text_snippet,
                 "url": current_url,
             })
+            self._url_counts[current_url] += 1
+            # Sorted rather than XOR-folded: repeated identical actions must not cancel each other out
+            turn_fp = hash(tuple(sorted(
+                (str(d.get("action")), str(d.get("text", "")), str(d.get("id", "")), str(d.get("coordinates")))
+                for d in actions_data
+            ))) if actions_data else 0
+            self._stuck_count = self._stuck_count + 1 if turn_fp and turn_fp == self._action_fp else 0
+            self._action_fp = turn_fp
+            self._url_stuck_count = self._url_stuck_count + 1 if current_url == self._last_url else 1
+            self._last_url = current_url
             print(f"[STEP JOURNAL] Turn {len(self._task_steps)} recorded. URL={current_url!r}")
             
             # --- Hard bailout: if the same non-empty URL has appeared 4+ times total ---
             if not is_done and current_url:
-                url_total_count = sum(1 for s in self._task_steps if s.get("url") == current_url)
+                url_total_count = self._url_counts[current_url]
                 if url_total_count >= 4:
                     bail_msg = (
                         f"🛑 I've been stuck on '{current_url}' for {url_total_count} turns "
@@ -768,33 +1646,23 @@ Return a JSON object:
                         "Please check the page and try again."
                     )
                     print(f"[STUCK BAILOUT] URL '{current_url}' seen {url_total_count} times. Aborting.")
-                    return bail_msg, True, None
+                    return bail_msg, True
 
             
             # Save to history only when the task is done
             if is_done:
                 self._task_steps = []  # Reset journal on task completion
-                self._last_action_fingerprint = ""  # Reset loop state on completion
+                self._url_stuck_count, self._last_url = 0, ""
+                self._url_counts.clear()
+                self._action_fp = 0  # Reset loop state on completion
                 self._stuck_count = 0
                 self.add_to_history(chat_id_str, user_instruction, actions_data, final_result)
             
-            # Generate TTS for the final answer if done
-            tts_path = None
-            if is_done and final_result and not final_result.startswith("IMAGE:"):
-                try:
-                    # Clean up the text for gTTS (remove special markdown characters)
-                    clean_text = final_result.replace("**", "").replace("_", "").replace("`", "")
-                    tts = gTTS(text=clean_text[:1000], lang='en')
-                    tts_path = f"tts_{chat_id}.voice"
-                    tts.save(tts_path)
-                except Exception as tts_e:
-                    print(f"TTS Error: {tts_e}")
-
-            return final_result, is_done, tts_path
+            return final_result, is_done
 
         except Exception as e:
             print(f"Error in analyze_and_act: {e}")
-            return f"Error: {e}", True, None
+            return f"Error: {e}", True
 
     async def generate_image(self, prompt: str) -> str:
         """
@@ -804,20 +1672,21 @@ Return a JSON object:
             # Add a 60-second timeout to prevent indefinite hangs
             response, model_used = await self._call_image_gen(prompt)
             
-            # Extract binary image data
-            image_bytes = None
-            if hasattr(response, 'candidates') and response.candidates:
-                for candidate in response.candidates:
-                    for part in candidate.content.parts:
-                        if hasattr(part, 'inline_data') and part.inline_data:
-                            if "image" in part.inline_data.mime_type:
-                                image_bytes = part.inline_data.data
-                                break
+            # Extract binary image data (first image part only)
+            image_bytes = next(
+                (
+                    part.inline_data.data
+                    for candidate in (getattr(response, 'candidates', None) or [])
+                    for part in candidate.content.parts
+                    if getattr(part, 'inline_data', None) and "image" in part.inline_data.mime_type
+                ),
+                None,
+            )
             
             if image_bytes:
-                filename = "generated_image.jpg"
-                with open(filename, "wb") as f:
-                    f.write(image_bytes)
+                # Content-hashed name so concurrent generations don't overwrite each other
+                filename = f"img_{hashlib.blake2b(image_bytes, digest_size=8).hexdigest()}.jpg"
+                await asyncio.to_thread(_write_bytes, filename, image_bytes)
                 return f"IMAGE:{filename}"
             
             # Fallback to response text if no image data found
@@ -830,25 +1699,20 @@ Return a JSON object:
             print(f"Error generating image: {str(e)}")
             return f"Error generating image: {str(e)}"
 
-    async def transcribe_audio(self, audio_file_path: str) -> str:
+    async def transcribe_audio(self, audio: bytes, mime_type: str = "audio/ogg") -> str:
         """
-        Transcribes the audio file using Gemini.
+        Transcribes the audio bytes using Gemini.
         Returns the transcribed text.
         """
         try:
-            # Upload the file using the modern genai SDK
-            audio_file = await self.client.aio.files.upload(file=audio_file_path)
-            
             prompt = "Transcribe this audio exactly as it is spoken. Do not include anything else in your response."
             
+            # Telegram caps bot downloads at 20 MB, so the clip is sent inline (no Files API upload/delete round-trips)
             response = await self._call_gemini(
-                contents=[audio_file, prompt],
-                config=types.GenerateContentConfig()
+                contents=[types.Part.from_bytes(data=audio, mime_type=mime_type), prompt],
+                config=_TRANSCRIBE_CONFIG
             )
             
-            # Cleanup uploaded file from Gemini storage
-            await self.client.aio.files.delete(name=audio_file.name)
-            
             return response.text.strip()
             
         except Exception as e:
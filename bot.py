@@ -1,8 +1,14 @@
+import io
 import os
+import re
+import queue
 import logging
+import logging.handlers
 import asyncio
+from gtts import gTTS
 from telegram import Update
-from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, MessageHandler, filters
+from telegram.constants import ChatAction
+from telegram.ext import ApplicationBuilder, ApplicationHandlerStop, BaseUpdateProcessor, ContextTypes, CommandHandler, MessageHandler, TypeHandler, filters
 
 from browser import BrowserManager
 from agent import Agent
@@ -13,62 +19,181 @@ logging.basicConfig(
     level=logging.INFO
 )
 
+# Hands log records to a background thread so stream writes never block the event loop (started by main)
+_log_queue = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(_log_queue, *logging.root.handlers, respect_handler_level=True)
+
 # Initialize global instances
 browser = BrowserManager()
 agent = None
 
 import time
-last_activity_time = time.time()
-needs_improvement = False
 last_chat_id = None
 
+# After this long without activity, the bot uses the idle time to improve its prompt (once per idle period)
+IDLE_IMPROVE_DELAY = 3600
+
+# Natural-language session reset phrases, matched anywhere in a message
+_RESET_RE = re.compile(r"reset session|blank session|clear session|reset browser|new session", re.IGNORECASE)
+
+# Markdown emphasis/code characters stripped from answers before speech synthesis
+_TTS_STRIP = str.maketrans("", "", "*_`")
+# Background voice replies, held here so they aren't garbage-collected before they finish
+_tts_tasks: set = set()
+
+# Minimum gap between edits of a streamed draft message (Telegram rate-limits edits)
+DRAFT_EDIT_INTERVAL = 1.0
+
+class StreamedDraft:
+    """Mirrors a streaming answer into a single Telegram message, editing it at most once per DRAFT_EDIT_INTERVAL."""
+
+    def __init__(self, context: ContextTypes.DEFAULT_TYPE, chat_id: int):
+        self.context = context
+        self.chat_id = chat_id
+        self.message = None
+        self._last_edit = 0.0
+
+    async def update(self, text: str):
+        now = time.monotonic()
+        if now - self._last_edit < DRAFT_EDIT_INTERVAL:
+            return
+        self._last_edit = now
+        draft = f"✍️ {text[:4000]}"
+        try:
+            if self.message is None:
+                self.message = await self.context.bot.send_message(chat_id=self.chat_id, text=draft)
+            else:
+                await self.message.edit_text(draft)
+        except Exception as e:
+            logging.warning(f"Could not update draft message: {e}")
+
+    async def finish(self, text: str) -> bool:
+        """Replaces the draft with the final text. Returns False if there is no draft to replace."""
+        if self.message is None:
+            return False
+        try:
+            await self.message.edit_text(text)
+        except Exception as e:
+            logging.warning(f"Could not finalize draft message: {e}")
+            return False
+        self.message = None # Delivered; a later discard() leaves it alone
+        return True
+
+    async def discard(self):
+        """Deletes the draft, so the next update starts a new one. For answers that are superseded or never delivered as text."""
+        if self.message is None:
+            return
+        message, self.message = self.message, None
+        self._last_edit = 0.0
+        try:
+            await message.delete()
+        except Exception as e:
+            logging.warning(f"Could not delete draft message: {e}")
+
 # Concurrency guard: one autonomous task per user at a time
 _user_locks: dict[int, asyncio.Lock] = {}
 
+# Text messages that arrive while a chat's task is running, joined into one request that runs once it finishes
+_pending_texts: dict[int, list[str]] = {}
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates from different chats concurrently while keeping each chat's own updates in order
+    (e.g. a photo is stored before the text message that refers to it is handled)."""
+
+    def __init__(self, max_concurrent_updates: int = 256):
+        super().__init__(max_concurrent_updates)
+        # chat id -> [lock, updates holding or waiting on it]; dropped once no update needs it
+        self._chat_locks: dict[int, list] = {}
+
+    async def do_process_update(self, update, coroutine):
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            await coroutine
+            return
+        entry = self._chat_locks.setdefault(chat.id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chat_locks[chat.id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+# Parsed whitelist, reloaded only when whitelist.txt's mtime changes (so edits apply without a restart)
+_whitelist_cache = {"mtime": None, "ids": frozenset()}
+
 def load_whitelist():
     try:
-        with open("whitelist.txt", "r") as f:
-            return set(line.strip() for line in f if line.strip())
+        mtime = os.stat("whitelist.txt").st_mtime_ns
     except FileNotFoundError:
-        return set()
+        mtime = None
+    if mtime != _whitelist_cache["mtime"]:
+        ids = set()
+        if mtime is not None:
+            try:
+                with open("whitelist.txt", "r") as f:
+                    for line in f:
+                        line = line.strip()
+                        if line:
+                            # Chat ids stored as ints so each check skips str(chat_id)
+                            ids.add(int(line) if line.lstrip("-").isdigit() else line)
+            except FileNotFoundError:
+                pass
+        _whitelist_cache["mtime"], _whitelist_cache["ids"] = mtime, frozenset(ids)
+    return _whitelist_cache["ids"]
 
 def is_authorized(chat_id):
     whitelist = load_whitelist()
     if not whitelist: # If empty/missing, allow all for now but warn
         return True
-    return str(chat_id) in whitelist
+    return chat_id in whitelist
+
+async def auth_gate(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Runs before every handler (group -1) and stops updates from chats outside the whitelist."""
+    chat = update.effective_chat
+    if chat is None or is_authorized(chat.id):
+        return
+    if update.effective_message:
+        await context.bot.send_message(chat_id=chat.id, text="Unauthorized access. Please contact the administrator.")
+    raise ApplicationHandlerStop
+
+def record_activity(context: ContextTypes.DEFAULT_TYPE, chat_id: int):
+    """Notes activity from a chat and pushes the one-shot idle job back to IDLE_IMPROVE_DELAY from now."""
+    global last_chat_id
+    last_chat_id = chat_id
+    for job in context.job_queue.get_jobs_by_name("idle_improve"):
+        job.schedule_removal()
+    context.job_queue.run_once(check_inactivity, when=IDLE_IMPROVE_DELAY, name="idle_improve")
 
 async def check_inactivity(context: ContextTypes.DEFAULT_TYPE):
-    global last_activity_time, needs_improvement, last_chat_id
+    """Runs once IDLE_IMPROVE_DELAY after the last activity; new activity reschedules it."""
+    logging.info("1 hour of inactivity detected. Asking Gemini to improve prompts...")
+    new_prompt_text = await agent.improve_prompt()
     
-    # Check if 3600 seconds (1 hour) have passed since the last activity AND we need improvement
-    if needs_improvement and (time.time() - last_activity_time > 3600):
-        needs_improvement = False # Only do this once per idle session
+    if new_prompt_text and last_chat_id:
+        logging.info("Prompt successfully improved and saved!")
         
-        logging.info("1 hour of inactivity detected. Asking Gemini to improve prompts...")
-        new_prompt_text = await agent.improve_prompt()
+        # Send the new prompt to the user (truncate to Telegram's 4096 char limit if necessary)
+        safe_text = new_prompt_text[:4000] if len(new_prompt_text) > 4000 else new_prompt_text
+        message = f"🧠 **I used my idle time to improve my instructions!**\n\nHere is my new internal prompt:\n\n```text\n{safe_text}\n```"
         
-        if new_prompt_text and last_chat_id:
-            logging.info("Prompt successfully improved and saved!")
-            
-            # Send the new prompt to the user (truncate to Telegram's 4096 char limit if necessary)
-            safe_text = new_prompt_text[:4000] if len(new_prompt_text) > 4000 else new_prompt_text
-            message = f"🧠 **I used my idle time to improve my instructions!**\n\nHere is my new internal prompt:\n\n```text\n{safe_text}\n```"
+        try:
+            await context.bot.send_message(chat_id=last_chat_id, text=message, parse_mode='Markdown')
+        except Exception as e:
+            logging.error(f"Failed to send improved prompt to chat: {e}")
             
-            try:
-                await context.bot.send_message(chat_id=last_chat_id, text=message, parse_mode='Markdown')
-            except Exception as e:
-                logging.error(f"Failed to send improved prompt to chat: {e}")
-                
-        else:
-            logging.error("Failed to improve prompt.")
+    else:
+        logging.error("Failed to improve prompt.")
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    if not is_authorized(chat_id):
-        await context.bot.send_message(chat_id=chat_id, text="Unauthorized access. Please contact the administrator.")
-        return
-
     global last_chat_id
     last_chat_id = chat_id
     await context.bot.send_message(
@@ -90,14 +215,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def browse_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    if not is_authorized(chat_id):
-        await context.bot.send_message(chat_id=chat_id, text="Unauthorized access.")
-        return
-
-    global last_activity_time, needs_improvement, last_chat_id
-    last_activity_time = time.time()
-    needs_improvement = True
-    last_chat_id = chat_id
+    record_activity(context, chat_id)
     
     url = ' '.join(context.args)
     if not url:
@@ -119,20 +237,14 @@ async def browse_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def reset_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    if not is_authorized(chat_id):
-        await context.bot.send_message(chat_id=chat_id, text="Unauthorized access.")
-        return
-
     await context.bot.send_message(chat_id=chat_id, text="🧹 Resetting browser session... This will clear all cookies and history.")
-    await browser.stop()
-    await browser.start() # Ensure it's ready for the next action
+    await browser.stop() # Relaunched on demand by the next browser task
     await context.bot.send_message(chat_id=chat_id, text="✨ Browser session has been reset! You now have a blank slate.")
     
-async def _solve_autonomous(chat_id: int, user_text: str, context: ContextTypes.DEFAULT_TYPE, user_image_path: str = None):
+async def _solve_autonomous(chat_id: int, user_text: str, context: ContextTypes.DEFAULT_TYPE, user_image: bytes = None):
     """
     Runs an autonomous loop, asking the agent for actions until it signals it is done or 10 minutes pass.
     """
-    from telegram.constants import ChatAction
 
     # --- Concurrency Guard: one task per user ---
     if chat_id not in _user_locks:
@@ -146,18 +258,53 @@ async def _solve_autonomous(chat_id: int, user_text: str, context: ContextTypes.
         return
 
     async with _user_locks[chat_id]:
-        await _solve_autonomous_inner(chat_id, user_text, context, user_image_path)
+        await _solve_autonomous_inner(chat_id, user_text, context, user_image)
+
+def _synthesize_speech(text: str) -> bytes:
+    """Returns gTTS audio for text, synthesized in memory."""
+    buf = io.BytesIO()
+    gTTS(text=text, lang='en').write_to_fp(buf)
+    return buf.getvalue()
+
+async def _send_tts(context: ContextTypes.DEFAULT_TYPE, chat_id: int, text: str):
+    voice = await asyncio.to_thread(_synthesize_speech, text)
+    await context.bot.send_voice(chat_id=chat_id, voice=voice)
+
+def _on_tts_done(task: asyncio.Task):
+    _tts_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logging.error(f"Error in TTS: {task.exception()}")
+
+async def _send_step_update(context: ContextTypes.DEFAULT_TYPE, chat_id: int, short_response: str, step_screenshot: bytes, step: int):
+    """Sends a step's status line and browser screenshot so the user can see what's happening.
+    Both go in one send_photo (status as the caption); a plain message if there is no screenshot."""
+    try:
+        if step_screenshot:
+            await context.bot.send_photo(chat_id=chat_id, photo=step_screenshot,
+                                         caption=f"⏳ {short_response}\n🌐 Browser state (step {step})")
+        else:
+            await context.bot.send_message(chat_id=chat_id, text=f"⏳ {short_response}")
+    except Exception as e:
+        print(f"Failed to send step update: {e}")
 
-async def _solve_autonomous_inner(chat_id: int, user_text: str, context: ContextTypes.DEFAULT_TYPE, user_image_path: str = None):
+async def _solve_autonomous_inner(chat_id: int, user_text: str, context: ContextTypes.DEFAULT_TYPE, user_image: bytes = None):
     """Inner function containing the actual autonomous logic, protected by the concurrency guard."""
-    from telegram.constants import ChatAction
-    
+    # One draft for the whole task, reused across verification retries
+    draft = StreamedDraft(context, chat_id)
+    try:
+        await _run_task(chat_id, user_text, context, user_image, draft)
+    finally:
+        # A streamed answer that was never delivered as text (image result, timeout, error) mustn't linger
+        await draft.discard()
+
+async def _run_task(chat_id: int, user_text: str, context: ContextTypes.DEFAULT_TYPE, user_image: bytes, draft: StreamedDraft):
     # 1. Decide Strategy: Direct vs Browser vs Image
     await context.bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
     strategy, direct_answer, image_prompt = await agent.decide_strategy(user_text, chat_id)
     
     final_output_text = ""
     final_image_path = None
+    final_screenshot = None
     
     if strategy == "DIRECT":
         final_output_text = direct_answer
@@ -191,12 +338,11 @@ async def _solve_autonomous_inner(chat_id: int, user_text: str, context: Context
             agent.reset_task_steps()
             
             is_done = False
-            step_tts_path = None
             browser_raw_answer = ""
+            step_delivery = None
             
             # Capture start state
-            start_url = await browser.get_url()
-            start_title = await browser.get_title()
+            start_url, start_title = await asyncio.gather(browser.get_url(), browser.get_title())
 
             while time.time() - start_time < max_duration:
                 await context.bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
@@ -216,32 +362,34 @@ async def _solve_autonomous_inner(chat_id: int, user_text: str, context: Context
                         await context.bot.send_message(chat_id=chat_id, text="Failed to start browser.")
                         return
 
-                step_text, is_done, step_tts = await agent.analyze_and_act(user_text, screenshot, chat_id, user_image_path)
+                step_text, is_done = await agent.analyze_and_act(user_text, screenshot, chat_id, user_image)
                 if not is_done:
                      short_response = step_text[:200] + "..." if len(step_text) > 200 else step_text
-                     await context.bot.send_message(chat_id=chat_id, text=f"⏳ {short_response}")
-                     # Send current browser screenshot so user can see what's happening
+                     # Capture the browser state now (before the next step draws SoM labels), but let the
+                     # Telegram uploads run while the next step's browser work and model call proceed
                      step_screenshot = await browser.take_screenshot()
-                     if step_screenshot:
-                         try:
-                             await context.bot.send_photo(chat_id=chat_id, photo=step_screenshot,
-                                                           caption=f"🌐 Browser state (step {len(agent._task_steps)})")
-                         except Exception as photo_err:
-                             print(f"Failed to send step screenshot: {photo_err}")
+                     if step_delivery:
+                         await step_delivery # Keep step updates in order
+                     step_delivery = asyncio.create_task(
+                         _send_step_update(context, chat_id, short_response, step_screenshot, len(agent._task_steps))
+                     )
 
                 else:
                      browser_raw_answer = step_text
-                     step_tts_path = step_tts # Store for later
                      break
+
+            if step_delivery:
+                await step_delivery
             
             if is_done:
-                # Capture end state
-                end_url = await browser.get_url()
-                end_title = await browser.get_title()
-
-                # 3. Refine the browser output
+                # 3. Refine the browser output, capturing the end state alongside.
+                # The answer streams into a draft message so the user sees it as it's written.
                 await context.bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
-                final_output_text = await agent.refine_answer(user_text, browser_raw_answer, chat_id)
+                end_url, end_title, final_output_text = await asyncio.gather(
+                    browser.get_url(),
+                    browser.get_title(),
+                    agent.refine_answer(user_text, browser_raw_answer, chat_id, on_partial=draft.update),
+                )
                 agent.update_last_history_result(chat_id, final_output_text)
                 
                 # Special check for image result from browser loop (if applicable)
@@ -257,7 +405,11 @@ async def _solve_autonomous_inner(chat_id: int, user_text: str, context: Context
             # Use states for verification context
             verification_context = f"Start Page: {start_title} ({start_url})\nEnd Page: {end_title} ({end_url})"
             
-            success, feedback = await agent.verify_result(f"{user_text}\n\nCONTEXT:\n{verification_context}", final_output_text, final_image_path, user_image_path)
+            # Capture the final screenshot for delivery while the verifier runs
+            (success, feedback), final_screenshot = await asyncio.gather(
+                agent.verify_result(f"{user_text}\n\nCONTEXT:\n{verification_context}", final_output_text, final_image_path, user_image),
+                browser.take_screenshot(),
+            )
             
             # Store verification results in session history
             agent.update_verification_to_history(chat_id, success, feedback)
@@ -265,6 +417,8 @@ async def _solve_autonomous_inner(chat_id: int, user_text: str, context: Context
             if not success:
                 retry_count += 1
                 if retry_count <= max_retries:
+                    # The unverified answer is superseded; the retry streams its own
+                    await draft.discard()
                     await context.bot.send_message(chat_id=chat_id, text=f"⚠️ Verification Failed: {feedback}\nI will adjust my plan and try again.")
                     # Trigger replanning with feedback
                     if agent.current_plan:
@@ -282,120 +436,108 @@ async def _solve_autonomous_inner(chat_id: int, user_text: str, context: Context
                 await context.bot.send_photo(chat_id=chat_id, photo=photo, caption="Here is your requested image!")
         except Exception as e:
             await context.bot.send_message(chat_id=chat_id, text=f"Error sending image: {e}")
+        finally:
+            # Generated images are content-hashed per request; don't let them pile up
+            if os.path.exists(final_image_path):
+                os.remove(final_image_path)
     else:
-        await context.bot.send_message(chat_id=chat_id, text=f"✨ {final_output_text}")
+        if not await draft.finish(f"✨ {final_output_text}"):
+            await context.bot.send_message(chat_id=chat_id, text=f"✨ {final_output_text}")
         
-    # Final TTS (for non-image answers)
+    # Final TTS (for non-image answers), delivered in the background so the rest of the reply isn't held up
     if not final_image_path:
-        try:
-            from gtts import gTTS
-            tts = gTTS(text=final_output_text[:1000], lang='en')
-            audio_path = f"tts_{chat_id}.voice"
-            tts.save(audio_path)
-            with open(audio_path, 'rb') as voice:
-                await context.bot.send_voice(chat_id=chat_id, voice=voice)
-            os.remove(audio_path)
-        except Exception as e:
-            logging.error(f"Error in TTS: {e}")
+        tts = asyncio.create_task(_send_tts(context, chat_id, final_output_text.translate(_TTS_STRIP)[:1000]))
+        _tts_tasks.add(tts)
+        tts.add_done_callback(_on_tts_done)
 
     # Optional final screenshot
     if strategy == "BROWSER" and not final_image_path:
-        final_screenshot = await browser.take_screenshot()
         if final_screenshot:
             await context.bot.send_photo(chat_id=chat_id, photo=final_screenshot)
 
-    # Clean up user image if it was used
-    if user_image_path and os.path.exists(user_image_path):
-        try:
-            os.remove(user_image_path)
-            if 'user_image_path' in context.user_data:
-                del context.user_data['user_image_path']
-        except:
-            pass
+    # The user image applies to this task only
+    if user_image:
+        context.user_data.pop('user_image', None)
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    if not is_authorized(chat_id):
-        await context.bot.send_message(chat_id=chat_id, text="Unauthorized access.")
-        return
-
-    global last_activity_time, needs_improvement, last_chat_id
-    last_activity_time = time.time()
-    needs_improvement = True
-    last_chat_id = chat_id
+    record_activity(context, chat_id)
     
     user_text = update.message.text
     if not user_text:
         return
 
     # Natural language session reset detection
-    reset_keywords = ["reset session", "blank session", "clear session", "reset browser", "new session"]
-    if any(kw in user_text.lower() for kw in reset_keywords):
+    if _RESET_RE.search(user_text):
         await context.bot.send_message(chat_id=chat_id, text="🧹 Natural language reset detected. Clearing browser session...")
-        await browser.stop()
-        await browser.start()
+        await browser.stop() # Relaunched on demand by the next browser task
         await context.bot.send_message(chat_id=chat_id, text="✨ Session reset complete. What's next?")
         return
 
-    # Check if we have a pending image from a previous upload
-    user_image_path = context.user_data.get('user_image_path')
+    # Messages sent while a task is running (including the tail of a long text Telegram split up)
+    # are held and run together as one request as soon as it finishes
+    pending = _pending_texts.get(chat_id)
+    if pending is not None:
+        pending.append(user_text)
+        return
+    lock = _user_locks.setdefault(chat_id, asyncio.Lock())
+    if lock.locked():
+        _pending_texts[chat_id] = [user_text]
+        await context.bot.send_message(chat_id=chat_id, text="📝 Noted. I'll get to this as soon as the current task finishes.")
+        asyncio.create_task(_solve_coalesced(chat_id, context))
+        return
+    # The lock is free, so this takes it without yielding: a message handled right after this one is held, not rejected
+    await lock.acquire()
+    asyncio.create_task(_solve_holding_lock(chat_id, user_text, context, context.user_data.get('user_image')))
+
+async def _solve_holding_lock(chat_id: int, user_text: str, context: ContextTypes.DEFAULT_TYPE, user_image: bytes = None):
+    try:
+        await _solve_autonomous_inner(chat_id, user_text, context, user_image)
+    finally:
+        _user_locks[chat_id].release()
+
+async def _solve_coalesced(chat_id: int, context: ContextTypes.DEFAULT_TYPE):
+    """Waits for the chat's running task to finish, then hands the held messages to the autonomous loop."""
+    async with _user_locks[chat_id]:
+        user_text = "\n".join(_pending_texts.pop(chat_id))
+
+        # Check if we have a pending image from a previous upload
+        user_image = context.user_data.get('user_image')
 
-    # Hand off to the autonomous loop
-    asyncio.create_task(_solve_autonomous(chat_id, user_text, context, user_image_path))
+        await _solve_autonomous_inner(chat_id, user_text, context, user_image)
 
 async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    if not is_authorized(chat_id):
-        await context.bot.send_message(chat_id=chat_id, text="Unauthorized access.")
-        return
-
-    global last_activity_time, needs_improvement, last_chat_id
-    last_activity_time = time.time()
-    needs_improvement = True
-    last_chat_id = chat_id
+    record_activity(context, chat_id)
     
     photo_file = await update.message.photo[-1].get_file()
-    user_image_path = f"user_photo_{chat_id}.jpg"
-    await photo_file.download_to_drive(user_image_path)
+    # Kept in memory: the photo is only ever sent on to Gemini, never needed on disk
+    user_image = bytes(await photo_file.download_as_bytearray())
     
-    context.user_data['user_image_path'] = user_image_path
+    context.user_data['user_image'] = user_image
     
     caption = update.message.caption
     if caption:
         await context.bot.send_message(chat_id=chat_id, text="📸 Image received with caption. Processing...")
-        asyncio.create_task(_solve_autonomous(chat_id, caption, context, user_image_path))
+        asyncio.create_task(_solve_autonomous(chat_id, caption, context, user_image))
     else:
         await context.bot.send_message(chat_id=chat_id, text="📸 I've received your image! What would you like me to do with it?")
 
 async def handle_audio(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    if not is_authorized(chat_id):
-        await context.bot.send_message(chat_id=chat_id, text="Unauthorized access.")
-        return
-
-    global last_activity_time, needs_improvement, last_chat_id
-    last_activity_time = time.time()
-    needs_improvement = True
-    last_chat_id = chat_id
+    record_activity(context, chat_id)
     
     message = update.message
     
-    if message.voice:
-        audio_file = await message.voice.get_file()
-    elif message.audio:
-        audio_file = await message.audio.get_file()
-    else:
+    media = message.voice or message.audio
+    if not media:
         return
+    audio_file = await media.get_file()
 
     await context.bot.send_message(chat_id=chat_id, text="🎙️ Listening and transcribing...")
     
-    temp_path = f"temp_audio_{chat_id}.ogg"
-    await audio_file.download_to_drive(temp_path)
-    
-    transcript = await agent.transcribe_audio(temp_path)
-    
-    if os.path.exists(temp_path):
-        os.remove(temp_path)
+    audio = bytes(await audio_file.download_as_bytearray())
+    transcript = await agent.transcribe_audio(audio, media.mime_type or "audio/ogg")
         
     if transcript.startswith("Error"):
         await context.bot.send_message(chat_id=chat_id, text=transcript)
@@ -404,10 +546,10 @@ async def handle_audio(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await context.bot.send_message(chat_id=chat_id, text=f"🗣️ I heard: '{transcript}'")
     
     # Check if we have a pending image
-    user_image_path = context.user_data.get('user_image_path')
+    user_image = context.user_data.get('user_image')
     
     # Hand off to autonomous logic
-    asyncio.create_task(_solve_autonomous(chat_id, transcript, context, user_image_path))
+    asyncio.create_task(_solve_autonomous(chat_id, transcript, context, user_image))
 
 if __name__ == '__main__':
     try:
@@ -428,7 +570,27 @@ if __name__ == '__main__':
         print(f"Error initializing Agent: {e}")
         exit(1)
 
-    application = ApplicationBuilder().token(bot_token).build()
+    # Use uvloop's faster event loop when it's installed (not available on Windows)
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        print("Using uvloop event loop.")
+    except ImportError:
+        pass
+
+    # A slow download or transcription in one chat no longer holds up updates from the others.
+    # The Bot API pool is pinned to that concurrency, waits briefly for a free connection
+    # instead of failing, and speaks HTTP/2 so concurrent sends share a connection.
+    application = (
+        ApplicationBuilder()
+        .token(bot_token)
+        .concurrent_updates(PerChatUpdateProcessor())
+        .connection_pool_size(256)
+        .pool_timeout(10)
+        .get_updates_connection_pool_size(8)
+        .http_version("2")
+        .build()
+    )
     
     start_handler = CommandHandler('start', start)
     browse_handler = CommandHandler(['browse', 'browser'], browse_command)
@@ -437,6 +599,8 @@ if __name__ == '__main__':
     audio_handler = MessageHandler(filters.VOICE | filters.AUDIO, handle_audio)
     photo_handler = MessageHandler(filters.PHOTO, handle_photo)
 
+    # Authorization runs once per update, ahead of every handler below
+    application.add_handler(TypeHandler(Update, auth_gate), group=-1)
     application.add_handler(start_handler)
     application.add_handler(browse_handler)
     application.add_handler(reset_handler)
@@ -444,8 +608,12 @@ if __name__ == '__main__':
     application.add_handler(audio_handler)
     application.add_handler(photo_handler)
 
-    # Start the background job to monitor inactivity every 5 seconds
-    application.job_queue.run_repeating(check_inactivity, interval=5)
-
-    print("Bot is polling...")
-    application.run_polling()
+    logging.root.handlers = [logging.handlers.QueueHandler(_log_queue)]
+    _log_listener.start()
+    try:
+        print("Bot is polling...")
+        application.run_polling()
+    finally:
+        # Flushes queued records and puts the real handlers back for anything logged during exit
+        _log_listener.stop()
+        logging.root.handlers = list(_log_listener.handlers)
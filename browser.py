@@ -1,12 +1,21 @@
-import asyncio
+import time
+import json
 from playwright.async_api import async_playwright, Page, BrowserContext
 
+# Max age of a reused screenshot when no action has touched the page since it was taken
+SCREENSHOT_CACHE_TTL = 2.0
+
 class BrowserManager:
     def __init__(self):
         self.playwright = None
         self.browser = None
         self.context: BrowserContext = None
         self.page: Page = None
+        # Bumped by every method that can change the page itself; keys the screenshot cache.
+        # The SoM overlay doesn't count: it is tracked separately so labelled and clean captures never mix.
+        self._page_version = 0
+        self._som_drawn = False
+        self._cached_screenshots = {} # som_drawn -> (version, taken_at, bytes)
 
     async def start(self):
         """Starts the Playwright browser."""
@@ -21,6 +30,8 @@ class BrowserManager:
             user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
         )
         self.page = await self.context.new_page()
+        self._cached_screenshots = {}
+        self._som_drawn = False
 
     async def stop(self):
         """Stops the browser and cleans up resources."""
@@ -32,6 +43,8 @@ class BrowserManager:
             await self.playwright.stop()
         
         self.page = None
+        self._cached_screenshots = {}
+        self._som_drawn = False
         self.context = None
         self.browser = None
         self.playwright = None
@@ -50,6 +63,7 @@ class BrowserManager:
         """Navigates to the specified URL."""
         if not self.page:
             await self.start()
+        self._page_version += 1
         try:
             await self.page.goto(url, wait_until="domcontentloaded", timeout=30000)
             return f"Navigated to {url}"
@@ -57,10 +71,23 @@ class BrowserManager:
             return f"Error navigating to {url}: {str(e)}"
 
     async def take_screenshot(self) -> bytes:
-        """Takes a screenshot of the current page and returns bytes."""
+        """Takes a screenshot of the current page and returns bytes. Reuses the last capture when
+        none of our actions touched the page since and it is younger than SCREENSHOT_CACHE_TTL
+        (the TTL bounds staleness from changes the page makes on its own)."""
         if not self.page:
             return None
-        return await self.page.screenshot(type="jpeg", quality=80)
+        som_drawn = self._som_drawn
+        cached = self._cached_screenshots.get(som_drawn)
+        if cached and cached[0] == self._page_version and time.monotonic() - cached[1] < SCREENSHOT_CACHE_TTL:
+            return cached[2]
+        version = self._page_version
+        screenshot = await self.page.screenshot(type="jpeg", quality=80)
+        self._cached_screenshots[som_drawn] = (version, time.monotonic(), screenshot)
+        return screenshot
+
+    def invalidate_screenshot_cache(self):
+        """Forces the next take_screenshot to capture the page, e.g. when it may have changed on its own."""
+        self._cached_screenshots = {}
 
     async def get_title(self) -> str:
         if not self.page:
@@ -77,6 +104,7 @@ class BrowserManager:
         """Clicks at the specified coordinates."""
         if not self.page:
             return "Browser not active"
+        self._page_version += 1
         await self.page.mouse.click(x, y)
         return f"Clicked at ({x}, {y})"
 
@@ -84,6 +112,7 @@ class BrowserManager:
         """Types text into the focused element."""
         if not self.page:
             return "Browser not active"
+        self._page_version += 1
         await self.page.keyboard.type(text)
         return f"Typed: {text}"
 
@@ -92,6 +121,7 @@ class BrowserManager:
         types the new text — replacing whatever was already in the field."""
         if not self.page:
             return "Browser not active"
+        self._page_version += 1
         # Triple-click selects the entire field value across all input types
         await self.page.mouse.click(x, y, click_count=3)
         await self.page.keyboard.press("Control+a")
@@ -102,6 +132,7 @@ class BrowserManager:
         """Presses a specific key (e.g., 'Enter', 'ArrowDown')."""
         if not self.page:
             return "Browser not active"
+        self._page_version += 1
         await self.page.keyboard.press(key)
         return f"Pressed key: {key}"
 
@@ -114,10 +145,21 @@ class BrowserManager:
         except Exception as e:
             return f"Error extracting text: {e}"
 
+    async def get_text_content_prefix(self, max_chars: int = 300) -> str:
+        """Returns only the first max_chars of visible body text. The slice happens in the page,
+        so large pages don't ship their whole text back over CDP."""
+        if not self.page:
+            return "Browser not active"
+        try:
+            return await self.page.evaluate("(n) => (document.body ? document.body.innerText : '').slice(0, n)", max_chars)
+        except Exception as e:
+            return f"Error extracting text: {e}"
+
     async def scroll(self, direction: str):
         """Scrolls the page up or down."""
         if not self.page:
             return "Browser not active"
+        self._page_version += 1
         
         if direction == "down":
             await self.page.evaluate("window.scrollBy(0, 500)")
@@ -132,6 +174,7 @@ class BrowserManager:
         PREFERRED over coordinate-based clicks for form fields."""
         if not self.page:
             return "Browser not active"
+        self._page_version += 1
         try:
             locator = self.page.get_by_placeholder(placeholder, exact=False)
             await locator.first.clear()
@@ -145,6 +188,7 @@ class BrowserManager:
         PREFERRED over coordinate-based clicks for form fields."""
         if not self.page:
             return "Browser not active"
+        self._page_version += 1
         try:
             locator = self.page.get_by_label(label, exact=False)
             await locator.first.clear()
@@ -158,6 +202,7 @@ class BrowserManager:
         PREFERRED over coordinate-based clicks for buttons."""
         if not self.page:
             return "Browser not active"
+        self._page_version += 1
         try:
             # Try button first, then any role
             locator = self.page.get_by_role("button", name=text, exact=False)
@@ -193,7 +238,6 @@ class BrowserManager:
                     })()
                 }));
             }""")
-            import json
             return json.dumps(fields, ensure_ascii=False)
         except Exception as e:
             return f"Error getting form fields: {e}"
@@ -226,6 +270,7 @@ class BrowserManager:
                 }
             });
         }""")
+        self._som_drawn = True
 
     async def remove_som(self):
         """Removes all SoM labels injected by draw_som."""
@@ -235,11 +280,13 @@ class BrowserManager:
             const labels = document.querySelectorAll('.openclaw-som-label');
             labels.forEach(l => l.remove());
         }""")
+        self._som_drawn = False
 
     async def click_by_id(self, som_id: int):
         """Clicks an element by its SoM ID."""
         if not self.page:
             return "Browser not active"
+        self._page_version += 1
         try:
             await self.page.click(f'[data-openclaw-id="{som_id}"]')
             return f"Clicked element #{som_id}"
@@ -250,6 +297,7 @@ class BrowserManager:
         """Fills an input by its SoM ID."""
         if not self.page:
             return "Browser not active"
+        self._page_version += 1
         try:
             locator = self.page.locator(f'[data-openclaw-id="{som_id}"]')
             await locator.clear()
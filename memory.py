@@ -1,10 +1,16 @@
+import atexit
 import json
 import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 
 class Memory:
     def __init__(self, sessions_file="sessions.json"):
         self.sessions_file = sessions_file
         self.ledger_file = "experience_ledger.json"
+        # One worker keeps background ledger writes in submission order
+        self._writer = ThreadPoolExecutor(max_workers=1)
+        atexit.register(self._writer.shutdown) # Waits for queued ledger writes before exiting
         self.experience = self._load_ledger()
 
     def _load_ledger(self):
@@ -17,8 +23,25 @@ class Memory:
         return {"successes": [], "failures": []}
 
     def _save_ledger(self):
-        with open(self.ledger_file, "w") as f:
-            json.dump(self.experience, f, indent=2)
+        """Snapshots the ledger now; inside the event loop the disk write runs in a worker thread."""
+        data = json.dumps(self.experience, indent=2)
+        try:
+            write = asyncio.get_running_loop().run_in_executor(self._writer, self._write_ledger, data)
+        except RuntimeError:
+            self._write_ledger(data)
+            return
+        write.add_done_callback(self._on_ledger_written)
+
+    @staticmethod
+    def _on_ledger_written(write):
+        if not write.cancelled() and write.exception() is not None:
+            print(f"[MEMORY] Warning: Could not save experience ledger ({write.exception()}).")
+
+    def _write_ledger(self, data):
+        tmp_file = self.ledger_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            f.write(data)
+        os.replace(tmp_file, self.ledger_file)
 
     def add_experience(self, instruction, success, feedback):
         entry = {
@@ -1,6 +1,10 @@
-import json
+import orjson
 from google.genai import types
 
+# Request configs are immutable, so build them once
+_CREATE_PLAN_CONFIG = types.GenerateContentConfig(response_mime_type="application/json", temperature=0.2)
+_UPDATE_PLAN_CONFIG = types.GenerateContentConfig(response_mime_type="application/json", temperature=0.3)
+
 class Planner:
     def __init__(self, agent):
         self.agent = agent
@@ -36,12 +40,9 @@ Return a JSON object:
         try:
             response = await self.agent._call_gemini(
                 contents=planning_prompt,
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json",
-                    temperature=0.2,
-                ),
+                config=_CREATE_PLAN_CONFIG,
             )
-            return json.loads(response.text)
+            return orjson.loads(response.text)
         except Exception as e:
             print(f"[PLANNER] Error creating plan: {e}")
             return {
@@ -56,7 +57,7 @@ Return a JSON object:
         Adjusts the plan based on feedback from a failed verification or a stuck state.
         """
         update_prompt = f"""
-CURRENT PLAN: {json.dumps(current_plan)}
+CURRENT PLAN: {orjson.dumps(current_plan).decode()}
 CURRENT STEP INDEX: {current_step_index}
 FEEDBACK/ISSUE: {feedback}
 
@@ -72,12 +73,9 @@ Return the updated plan as a JSON object:
         try:
             response = await self.agent._call_gemini(
                 contents=update_prompt,
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json",
-                    temperature=0.3,
-                ),
+                config=_UPDATE_PLAN_CONFIG,
             )
-            return json.loads(response.text)
+            return orjson.loads(response.text)
         except Exception as e:
             print(f"[PLANNER] Error updating plan: {e}")
             return current_plan
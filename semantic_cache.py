@@ -0,0 +1,72 @@
+import math
+import time
+import sqlite3
+import threading
+from array import array
+
+class SemanticCache:
+    """Stores answers keyed by the embedding of the question that produced them.
+    A lookup returns a stored answer when a new question is close enough in meaning
+    (cosine similarity) to one asked before in the same namespace. Each namespace keeps
+    at most max_entries answers, the newest ones."""
+
+    def __init__(self, db_file="semantic_cache.db", threshold=0.92, ttl=3600, max_entries=256):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Shared by the worker threads lookup/store are run in; the lock keeps them off it at the same time
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                namespace TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                response BLOB NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_namespace ON entries (namespace, created_at)")
+        self.conn.commit()
+
+    @staticmethod
+    def _normalize(vector) -> array:
+        norm = math.sqrt(math.sumprod(vector, vector)) or 1.0
+        return array("f", (v / norm for v in vector))
+
+    def lookup(self, namespace: str, vector) -> bytes | None:
+        """Returns the best stored response above the similarity threshold, or None."""
+        query = self._normalize(vector)
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT embedding, response FROM entries WHERE namespace = ? AND created_at > ?",
+                (namespace, time.time() - self.ttl),
+            ).fetchall()
+        best_score, best_response = self.threshold, None
+        for blob, response in rows:
+            stored = array("f")
+            stored.frombytes(blob)
+            if len(stored) != len(query):
+                continue
+            # Both vectors are unit length, so the dot product is the cosine similarity
+            score = math.sumprod(query, stored)
+            if score >= best_score:
+                best_score, best_response = score, response
+        return best_response
+
+    def store(self, namespace: str, vector, response: bytes):
+        """Saves a response under the given embedding, then drops expired entries and
+        the oldest ones beyond max_entries in this namespace."""
+        now = time.time()
+        embedding = self._normalize(vector).tobytes()
+        with self._lock:
+            self.conn.execute("DELETE FROM entries WHERE created_at <= ?", (now - self.ttl,))
+            self.conn.execute(
+                "INSERT INTO entries (namespace, embedding, response, created_at) VALUES (?, ?, ?, ?)",
+                (namespace, embedding, response, now),
+            )
+            self.conn.execute(
+                """DELETE FROM entries WHERE namespace = ? AND rowid NOT IN (
+                       SELECT rowid FROM entries WHERE namespace = ? ORDER BY created_at DESC LIMIT ?)""",
+                (namespace, namespace, self.max_entries),
+            )
+            self.conn.commit()
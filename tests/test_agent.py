@@ -0,0 +1,176 @@
+import os
+import sys
+import tempfile
+import types as pytypes
+import unittest
+from collections import deque
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import orjson
+from google.genai import types
+
+import agent
+from agent import Agent, ActionStreamParser
+
+
+class FakeModels:
+    def __init__(self, models):
+        self._models = models
+        self.list_calls = 0
+
+    def list(self):
+        self.list_calls += 1
+        return iter(self._models)
+
+
+class ModelRankingCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp.name)
+        self.models = FakeModels([
+            types.Model(name="models/gemini-2.5-flash", supported_actions=["generateContent", "countTokens"]),
+            types.Model(name="models/gemini-2.5-pro", supported_actions=["generateContent"]),
+            types.Model(name="models/nano-banana-pro-preview", supported_actions=["generateContent"]),
+            types.Model(name="models/gemini-embedding-001", supported_actions=["embedContent"]),
+        ])
+        self.agent = Agent.__new__(Agent)
+        self.agent.client = pytypes.SimpleNamespace(models=self.models)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+
+    def test_ranking_run_writes_cache(self):
+        self.agent._load_models()
+
+        self.assertEqual(self.agent.ranked_models[0], "models/gemini-2.5-pro")
+        self.assertEqual(self.agent.image_models, ["models/nano-banana-pro-preview"])
+        with open(agent.MODELS_CACHE_FILE, "rb") as f:
+            cache = orjson.loads(f.read())
+        self.assertEqual(cache["ranked"], self.agent.ranked_models)
+        self.assertEqual(cache["image"], self.agent.image_models)
+
+    def test_fresh_cache_skips_listing(self):
+        self.agent._load_models()
+        again = Agent.__new__(Agent)
+        again.client = self.agent.client
+        again._load_models()
+
+        self.assertEqual(self.models.list_calls, 1)
+        self.assertEqual(again.ranked_models, self.agent.ranked_models)
+
+    def test_listing_failure_does_not_write_cache(self):
+        def fail():
+            raise RuntimeError("API key not valid")
+        self.models.list = fail
+        self.agent._load_models()
+
+        self.assertFalse(os.path.exists(agent.MODELS_CACHE_FILE))
+
+
+class ModelNotFoundTest(unittest.TestCase):
+    def test_404_naming_the_model(self):
+        e = Exception("404 NOT_FOUND. models/gemini-1.0-pro is not found for API version v1beta")
+
+        self.assertTrue(agent._is_model_not_found(e, "gemini-1.0-pro"))
+        self.assertTrue(agent._is_model_not_found(e, "models/gemini-1.0-pro"))
+
+    def test_404_for_other_resources(self):
+        for message in ("404 NOT_FOUND. CachedContent not found (or permission denied)",
+                        "404 NOT_FOUND. File files/abc123 not found"):
+            self.assertFalse(agent._is_model_not_found(Exception(message), "models/gemini-2.5-flash"))
+
+
+class ActionStreamParserTest(unittest.TestCase):
+    def feed_in_chunks(self, text, size=7):
+        parser = ActionStreamParser()
+        actions = []
+        for i in range(0, len(text), size):
+            actions += parser.feed(text[i:i + size])
+        return actions
+
+    def test_actions_are_emitted_as_they_complete(self):
+        parser = ActionStreamParser()
+        self.assertEqual(parser.feed('{"thought": "go", "actions": [{"action": "scroll", "direction": "down"}, {"act'), [
+            {"action": "scroll", "direction": "down"},
+        ])
+        self.assertEqual(parser.feed('ion": "done", "text": null}]}'), [{"action": "done"}])
+
+    def test_escaped_actions_key_inside_thought_is_ignored(self):
+        text = ('{"thought": "The form says \\"actions\\": [{\\"action\\": \\"click\\"}] but I should read first", '
+                '"actions": [{"action": "read", "text": "a } brace and \\"quote\\""}]}')
+
+        self.assertEqual(self.feed_in_chunks(text), [{"action": "read", "text": 'a } brace and "quote"'}])
+
+    def test_bare_array_response(self):
+        self.assertEqual(self.feed_in_chunks('[{"action": "key", "text": "Enter"}, {"action": "done"}]'), [
+            {"action": "key", "text": "Enter"},
+            {"action": "done"},
+        ])
+
+
+def session_agent(sessions_dir):
+    """An Agent with only the session-log state set up, so no API client is needed."""
+    session = Agent.__new__(Agent)
+    session.sessions_dir = sessions_dir
+    session.history = {}
+    session._pending_records = {}
+    session._log_records = {}
+    session._history_versions = {}
+    session._history_contexts = {}
+    session._flush_task = None
+    return session
+
+
+class SessionLogTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.agent = session_agent(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def replay(self, chat_id):
+        return session_agent(self._tmp.name).get_history(chat_id)
+
+    def test_log_replays_adds_and_updates(self):
+        self.agent.add_to_history("1", "first", [{"action": "read"}], "raw")
+        self.agent.update_last_history_result("1", "refined")
+        self.agent.add_to_history("1", "second", [], "answer")
+
+        self.assertEqual(list(self.replay("1")), list(self.agent.get_history("1")))
+        self.assertEqual(self.replay("1")[0][2], "refined")
+
+    def test_compaction_round_trips(self):
+        with mock.patch.object(agent, "SESSION_LOG_MAX_RECORDS", 4):
+            for i in range(2):
+                self.agent.add_to_history("1", f"q{i}", [], f"a{i}")
+                self.agent.update_last_history_result("1", f"refined{i}")
+            # The fifth record pushes the log past the cap, so it is rewritten as a snapshot
+            self.agent.add_to_history("1", "q2", [], "a2")
+            with open(self.agent._session_path("1"), "rb") as f:
+                records = [orjson.loads(line) for line in f]
+            self.assertEqual([r["op"] for r in records], ["add", "add", "add"])
+
+            # Later records append to the compacted log again
+            self.agent.update_last_history_result("1", "refined2")
+
+        self.assertEqual(self.agent._log_records["1"], 4)
+        self.assertEqual(list(self.replay("1")), list(self.agent.get_history("1")))
+        self.assertEqual([e[2] for e in self.replay("1")], ["refined0", "refined1", "refined2"])
+
+    def test_torn_last_line_is_skipped(self):
+        self.agent.add_to_history("1", "kept", [], "answer")
+        with open(self.agent._session_path("1"), "ab") as f:
+            f.write(b'{"op": "add", "entry": ["torn')
+
+        hist, records = self.agent._read_session("1")
+        self.assertEqual(hist, deque([["kept", "[]", "answer", None, None]]))
+        self.assertEqual(records, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
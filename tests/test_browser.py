@@ -0,0 +1,83 @@
+import os
+import sys
+import types
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import playwright.async_api  # noqa: F401
+except ImportError:
+    # BrowserManager only needs these names at import time; the tests drive a fake page
+    _async_api = types.ModuleType("playwright.async_api")
+    _async_api.async_playwright = _async_api.Page = _async_api.BrowserContext = None
+    sys.modules["playwright"] = types.ModuleType("playwright")
+    sys.modules["playwright.async_api"] = _async_api
+
+from browser import BrowserManager
+
+
+class FakePage:
+    """Returns a distinct JPEG payload per capture and records overlay state, like a real page would render it."""
+
+    def __init__(self):
+        self.captures = 0
+        self.labels = False
+        self.url = "https://example.com/"
+
+    async def screenshot(self, **kwargs):
+        self.captures += 1
+        return f"frame-{self.captures}-{'som' if self.labels else 'clean'}".encode()
+
+    async def evaluate(self, script, *args):
+        if "openclaw-som-label" in script:
+            self.labels = "createElement" in script
+
+
+class ScreenshotCacheTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.browser = BrowserManager()
+        self.page = FakePage()
+        self.browser.page = self.page
+
+    async def test_clean_capture_is_reused_after_remove_som(self):
+        clean = await self.browser.take_screenshot()
+        await self.browser.draw_som()
+        labelled = await self.browser.take_screenshot()
+        await self.browser.remove_som()
+        again = await self.browser.take_screenshot()
+
+        self.assertEqual(again, clean)
+        self.assertNotEqual(labelled, clean)
+        self.assertEqual(self.page.captures, 2)
+
+    async def test_labelled_capture_is_not_served_from_clean_cache(self):
+        await self.browser.take_screenshot()
+        await self.browser.draw_som()
+        labelled = await self.browser.take_screenshot()
+
+        self.assertTrue(labelled.endswith(b"som"))
+
+    async def test_page_action_invalidates_cache(self):
+        first = await self.browser.take_screenshot()
+        await self.browser.scroll("down")
+        second = await self.browser.take_screenshot()
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(self.page.captures, 2)
+
+    async def test_invalidate_forces_fresh_capture(self):
+        # After the agent skips an unchanged turn nothing bumps the page version; the page may still change itself
+        await self.browser.draw_som()
+        first = await self.browser.take_screenshot()
+        await self.browser.remove_som()
+        self.browser.invalidate_screenshot_cache()
+        await self.browser.draw_som()
+        second = await self.browser.take_screenshot()
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(self.page.captures, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
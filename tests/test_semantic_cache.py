@@ -0,0 +1,70 @@
+import os
+import sys
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from semantic_cache import SemanticCache
+
+
+class SemanticCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.cache = SemanticCache(db_file=os.path.join(self._tmp.name, "cache.db"), threshold=0.9)
+
+    def tearDown(self):
+        self.cache.conn.close()
+        self._tmp.cleanup()
+
+    def test_hit_on_near_duplicate(self):
+        self.cache.store("chat", [1.0, 0.0, 0.0], b"answer")
+
+        self.assertEqual(self.cache.lookup("chat", [0.99, 0.05, 0.0]), b"answer")
+
+    def test_miss_below_threshold(self):
+        self.cache.store("chat", [1.0, 0.0, 0.0], b"answer")
+
+        # cos = 0.8: related, but not the same question
+        self.assertIsNone(self.cache.lookup("chat", [0.8, 0.6, 0.0]))
+
+    def test_best_match_wins(self):
+        self.cache.store("chat", [0.92, 0.39191836, 0.0], b"close")
+        self.cache.store("chat", [0.95, 0.31224990, 0.0], b"closer")
+
+        self.assertEqual(self.cache.lookup("chat", [1.0, 0.0, 0.0]), b"closer")
+
+    def test_namespaces_are_isolated(self):
+        self.cache.store("chat-a", [1.0, 0.0], b"answer")
+
+        self.assertIsNone(self.cache.lookup("chat-b", [1.0, 0.0]))
+
+    def test_expired_entries_miss(self):
+        self.cache.ttl = -1
+        self.cache.store("chat", [1.0, 0.0], b"answer")
+
+        self.assertIsNone(self.cache.lookup("chat", [1.0, 0.0]))
+
+    def test_keeps_newest_max_entries(self):
+        self.cache.max_entries = 2
+        for i, vector in enumerate(([1.0, 0.0], [0.0, 1.0], [-1.0, 0.0])):
+            self.cache.store("chat", vector, f"answer-{i}".encode())
+
+        self.assertIsNone(self.cache.lookup("chat", [1.0, 0.0]))
+        self.assertEqual(self.cache.lookup("chat", [-1.0, 0.0]), b"answer-2")
+
+    def test_concurrent_use_from_worker_threads(self):
+        def store_and_lookup(i):
+            vector = [1.0, i / 1000]
+            self.cache.store(f"chat-{i % 4}", vector, str(i).encode())
+            return self.cache.lookup(f"chat-{i % 4}", vector)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(store_and_lookup, range(64)))
+
+        self.assertTrue(all(results))
+
+
+if __name__ == "__main__":
+    unittest.main()